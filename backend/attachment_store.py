@@ -0,0 +1,212 @@
+import os
+import time
+import asyncio
+import sqlite3
+import hashlib
+import threading
+
+from reply_cache import CACHE_DIR
+
+ATTACHMENT_CACHE_DIR = os.getenv("ATTACHMENT_CACHE_DIR", os.path.join(CACHE_DIR, "attachments"))
+# Disk budget shared by raw PDFs and their extracted text
+ATTACHMENT_CACHE_BYTES = int(os.getenv("ATTACHMENT_CACHE_BYTES", str(512 * 1024 * 1024)))
+# Seconds a path returned by get_file is protected from eviction: long enough for the
+# response to open it, after which removing the file no longer affects the open handle
+ATTACHMENT_LEASE_SECONDS = float(os.getenv("ATTACHMENT_LEASE_SECONDS", "60"))
+# Striped locks so concurrent requests for one attachment download it once
+KEY_LOCK_STRIPES = 64
+
+
+class AttachmentStore:
+    """
+    Content-addressed cache for attachments. (message id, attachment id) maps to the
+    SHA-256 of the raw bytes; the bytes and the extracted text are stored as files
+    named by that hash, so the same PDF attached to several messages is kept once.
+    Files are evicted least-recently-used when the disk budget is exceeded.
+    """
+
+    def __init__(self, root: str = ATTACHMENT_CACHE_DIR, max_bytes: int = ATTACHMENT_CACHE_BYTES):
+        self.root = root
+        self.max_bytes = max_bytes
+        os.makedirs(root, exist_ok=True)
+        self._lock = threading.Lock()
+        self._key_locks = [threading.Lock() for _ in range(KEY_LOCK_STRIPES)]
+        # file name -> monotonic time its get_file lease ends
+        self._leases = {}
+        self.hits = 0
+        self.misses = 0
+        self.text_hits = 0
+        self.text_misses = 0
+        self.evictions = 0
+
+        self._db = sqlite3.connect(os.path.join(root, "index.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS attachments ("
+            "message_id TEXT, attachment_id TEXT, sha256 TEXT NOT NULL, "
+            "PRIMARY KEY (message_id, attachment_id))"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS files (name TEXT PRIMARY KEY, size INTEGER NOT NULL, last_access REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.root, name[:2], name)
+
+    def _key_lock(self, key) -> threading.Lock:
+        return self._key_locks[hash(key) % KEY_LOCK_STRIPES]
+
+    def _touch(self, name: str):
+        with self._lock:
+            self._db.execute("UPDATE files SET last_access = ? WHERE name = ?", (time.time(), name))
+            self._db.commit()
+
+    def _read(self, name: str):
+        try:
+            with open(self._path(name), "rb") as f:
+                data = f.read()
+        except FileNotFoundError:
+            return None
+        self._touch(name)
+        return data
+
+    def _write(self, name: str, data: bytes):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with self._lock:
+            self._db.execute(
+                "INSERT OR REPLACE INTO files (name, size, last_access) VALUES (?, ?, ?)",
+                (name, len(data), time.time())
+            )
+            self._db.commit()
+            self._evict(keep=name)
+
+    def _evict(self, keep: str = None):
+        """Remove least-recently-used files until under budget, sparing keep and leased files"""
+        total = self._db.execute("SELECT COALESCE(SUM(size), 0) FROM files").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        now = time.monotonic()
+        self._leases = {name: until for name, until in self._leases.items() if until > now}
+        for name, size in self._db.execute("SELECT name, size FROM files ORDER BY last_access").fetchall():
+            if total <= self.max_bytes:
+                break
+            if name == keep or name in self._leases:
+                continue
+            try:
+                os.remove(self._path(name))
+            except FileNotFoundError:
+                pass
+            self._db.execute("DELETE FROM files WHERE name = ?", (name,))
+            total -= size
+            self.evictions += 1
+        self._db.commit()
+
+    def put_bytes(self, data: bytes) -> str:
+        sha = hashlib.sha256(data).hexdigest()
+        if not os.path.exists(self._path(sha)):
+            self._write(sha, data)
+        return sha
+
+    def get_bytes(self, message_id: str, attachment_id: str, fetch) -> tuple:
+        """Return (sha256, bytes), calling fetch(message_id, attachment_id) at most once per attachment"""
+        with self._key_lock((message_id, attachment_id)):
+            with self._lock:
+                row = self._db.execute(
+                    "SELECT sha256 FROM attachments WHERE message_id = ? AND attachment_id = ?",
+                    (message_id, attachment_id)
+                ).fetchone()
+            data = self._read(row[0]) if row else None
+            if data is not None:
+                self.hits += 1
+                return row[0], data
+
+            self.misses += 1
+            data = fetch(message_id, attachment_id)
+            sha = self.put_bytes(data)
+            with self._lock:
+                self._db.execute(
+                    "INSERT OR REPLACE INTO attachments (message_id, attachment_id, sha256) VALUES (?, ?, ?)",
+                    (message_id, attachment_id, sha)
+                )
+                self._db.commit()
+            return sha, data
+
+    def lookup(self, message_id: str, attachment_id: str):
+        """SHA-256 of an attachment whose bytes are on disk, or None"""
+        with self._lock:
+            row = self._db.execute(
+                "SELECT sha256 FROM attachments WHERE message_id = ? AND attachment_id = ?",
+                (message_id, attachment_id)
+            ).fetchone()
+        return row[0] if row and os.path.exists(self._path(row[0])) else None
+
+    def get_file(self, message_id: str, attachment_id: str, fetch) -> tuple:
+        """
+        Return (sha256, path) of the cached file without reading it, downloading first on a miss.
+        The path is leased: it is not evicted for ATTACHMENT_LEASE_SECONDS, so a response can open it.
+        """
+        sha = self.lookup(message_id, attachment_id)
+        if sha is not None:
+            self.hits += 1
+        while True:
+            if sha is None:
+                sha, _ = self.get_bytes(message_id, attachment_id, fetch)
+            path = self._path(sha)
+            with self._lock:
+                # Another write may have evicted it since the lookup; fetch it again if so
+                if os.path.exists(path):
+                    self._leases[sha] = time.monotonic() + ATTACHMENT_LEASE_SECONDS
+                    self._db.execute("UPDATE files SET last_access = ? WHERE name = ?", (time.time(), sha))
+                    self._db.commit()
+                    return sha, path
+            sha = None
+
+    def get_text(self, sha: str, variant: str = "text"):
+        data = self._read(f"{sha}.{variant}")
+        if data is None:
+            self.text_misses += 1
+            return None
+        self.text_hits += 1
+        return data.decode("utf-8")
+
+    def put_text(self, sha: str, text: str, variant: str = "text"):
+        self._write(f"{sha}.{variant}", text.encode("utf-8"))
+
+    def stats(self) -> dict:
+        with self._lock:
+            files, size = self._db.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM files").fetchone()
+        return {
+            "files": files,
+            "bytes": size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "text_hits": self.text_hits,
+            "text_misses": self.text_misses,
+            "evictions": self.evictions
+        }
+
+
+class SingleFlight:
+    """Collapses concurrent async calls for the same key into one execution"""
+
+    def __init__(self):
+        self._inflight = {}
+
+    async def run(self, key, fn):
+        future = self._inflight.get(key)
+        if future is None:
+            future = asyncio.ensure_future(fn())
+            self._inflight[key] = future
+            future.add_done_callback(lambda _: self._inflight.pop(key, None))
+        return await asyncio.shield(future)
+
+    def pending(self, key):
+        """The in-flight future for key, or None"""
+        return self._inflight.get(key)
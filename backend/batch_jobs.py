@@ -0,0 +1,118 @@
+import os
+import time
+import uuid
+import asyncio
+from collections import OrderedDict
+
+# Items of one job in flight at once; the rate limiters decide actual throughput
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "16"))
+BATCH_MAX_ITEMS = int(os.getenv("BATCH_MAX_ITEMS", "200"))
+# Finished jobs kept around for polling
+BATCH_MAX_JOBS = int(os.getenv("BATCH_MAX_JOBS", "100"))
+
+
+class BatchJob:
+    """One bulk generation: per-item status plus the order in which items finished"""
+
+    def __init__(self, items: list):
+        self.id = uuid.uuid4().hex
+        self.items = [{"index": i, **item, "status": "pending"} for i, item in enumerate(items)]
+        self.finished = []
+        self.created = time.time()
+        self.completed_at = None
+        self.changed = asyncio.Condition()
+        self.task = None
+
+    @property
+    def done(self) -> bool:
+        return len(self.finished) == len(self.items)
+
+    def snapshot(self, since: int = 0) -> dict:
+        """Job summary; items finished after position `since` are included in finish order"""
+        counts = {}
+        for item in self.items:
+            counts[item["status"]] = counts.get(item["status"], 0) + 1
+        return {
+            "job_id": self.id,
+            "total": len(self.items),
+            "counts": counts,
+            "done": self.done,
+            "elapsed": round((self.completed_at or time.time()) - self.created, 3),
+            "next": len(self.finished),
+            "results": [self.items[i] for i in self.finished[since:]]
+        }
+
+    async def updates(self):
+        """Yield items as they finish, ending when the whole job is done"""
+        cursor = 0
+        while True:
+            async with self.changed:
+                await self.changed.wait_for(lambda: len(self.finished) > cursor or self.done)
+                ready = self.finished[cursor:]
+            for index in ready:
+                yield self.items[index]
+            cursor += len(ready)
+            if self.done and cursor == len(self.finished):
+                return
+
+
+class BatchJobManager:
+    """
+    Runs bulk jobs as background tasks. Every item calls process(item) concurrently
+    (bounded per job); pacing against provider limits is left to the shared rate limiters.
+    """
+
+    def __init__(self, process, concurrency: int = BATCH_CONCURRENCY, max_jobs: int = BATCH_MAX_JOBS):
+        self.process = process
+        self.concurrency = concurrency
+        self.max_jobs = max_jobs
+        self.jobs = OrderedDict()
+
+    def submit(self, items: list) -> BatchJob:
+        job = BatchJob(items)
+        self.jobs[job.id] = job
+        while len(self.jobs) > self.max_jobs:
+            oldest = next(iter(self.jobs.values()))
+            if not oldest.done:
+                break
+            self.jobs.popitem(last=False)
+        job.task = asyncio.create_task(self._run(job))
+        return job
+
+    def get(self, job_id: str):
+        return self.jobs.get(job_id)
+
+    async def _run(self, job: BatchJob):
+        semaphore = asyncio.Semaphore(self.concurrency)
+
+        async def run_item(item: dict):
+            async with semaphore:
+                item["status"] = "running"
+                started = time.time()
+                try:
+                    item["result"] = await self.process(item)
+                    item["status"] = "done"
+                except Exception as e:
+                    item["error"] = getattr(e, "detail", None) or str(e)
+                    item["status"] = "failed"
+                item["seconds"] = round(time.time() - started, 3)
+            async with job.changed:
+                job.finished.append(item["index"])
+                if job.done:
+                    job.completed_at = time.time()
+                job.changed.notify_all()
+
+        await asyncio.gather(*(run_item(item) for item in job.items))
+
+    async def shutdown(self):
+        tasks = [job.task for job in self.jobs.values() if job.task and not job.task.done()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> dict:
+        return {
+            "jobs": len(self.jobs),
+            "running": sum(1 for job in self.jobs.values() if not job.done),
+            "concurrency": self.concurrency
+        }
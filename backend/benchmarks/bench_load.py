@@ -0,0 +1,214 @@
+"""
+Load-test the API against local Gmail and OpenAI stand-ins.
+
+Starts benchmarks.fake_gmail, benchmarks.fake_openai and a uvicorn worker pointed
+at them, then drives each scenario at rising concurrency for a fixed duration
+and reports p50/p95/p99 latency and requests/sec. Pass --baseline with an
+earlier --json result to fail (exit 1) on regressions beyond --tolerance.
+
+    cd backend
+    python -m benchmarks.bench_load --concurrency 1 4 16 --duration 10
+    python -m benchmarks.bench_load --json after.json --baseline before.json --tolerance 0.2
+"""
+import os
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import tempfile
+import subprocess
+
+import httpx
+
+SCENARIOS = ("emails", "generate", "generate_with_pdf", "send")
+
+
+def start(args: list, env: dict = None, quiet: bool = False) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, *args], env=env, stdout=subprocess.DEVNULL if quiet else None)
+
+
+def wait_for(url: str, timeout: float, ok=lambda r: r.status_code == 200):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if ok(httpx.get(url, timeout=2)):
+                return
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.1)
+    raise SystemExit(f"{url} not ready within {timeout}s")
+
+
+def worker_env(args) -> dict:
+    env = dict(os.environ)
+    env.update({
+        "GMAIL_API_ENDPOINT": f"http://127.0.0.1:{args.gmail_port}/",
+        "GMAIL_ACCESS_TOKEN": "bench-token",
+        "OPENAI_BASE_URL": f"http://127.0.0.1:{args.openai_port}/v1",
+        "OPENAI_API_KEY": "sk-bench",
+        # A throwaway cache and no background work competing with the measured requests
+        "CACHE_DIR": tempfile.mkdtemp(prefix="bench-load-"),
+        "PREGEN_ENABLED": "0",
+        "SENT_CORPUS_ENABLED": "0",
+    })
+    if not args.real_limits:
+        # The stand-ins have no quotas; keep the client-side pacing from dominating the numbers
+        env.update({"OPENAI_RPM": "1000000", "OPENAI_TPM": "1000000000", "GMAIL_QUOTA_PER_SECOND": "1000000"})
+    return env
+
+
+def build_request(scenario: str, args) -> dict:
+    message_id = f"m{random.randrange(args.messages):05d}"
+    if scenario == "emails":
+        return {"method": "GET", "url": "/emails", "params": {"page_size": 20}}
+    if scenario == "generate":
+        return {"method": "POST", "url": "/generate", "data": {
+            "email_text": f"Hi, can we move the review of invoice {random.randrange(10 ** 6)} to Thursday?",
+            "force_regenerate": str(not args.allow_cache).lower()}}
+    if scenario == "generate_with_pdf":
+        return {"method": "GET", "url": "/generate_with_pdf", "params": {
+            "id": message_id, "force_regenerate": str(not args.allow_cache).lower(), "attachments": args.attachments}}
+    return {"method": "POST", "url": "/send", "data": {
+        "to": "someone@example.com", "subject": "Re: update", "body": "Thanks, see you Thursday."}}
+
+
+def failure(response: httpx.Response):
+    """None for a successful call, else a short description of what went wrong"""
+    if response.status_code != 200:
+        return f"HTTP {response.status_code}"
+    body = response.json()
+    if "error" in body or body.get("status") == "error":
+        return str(body.get("error") or body.get("message"))[:200]
+    return None
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))] if ordered else float("nan")
+
+
+async def run_level(base_url: str, scenario: str, concurrency: int, args) -> dict:
+    latencies, errors = [], []
+    deadline = time.perf_counter() + args.duration
+
+    async def user(client: httpx.AsyncClient):
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            try:
+                error = failure(await client.request(**build_request(scenario, args)))
+            except httpx.HTTPError as e:
+                error = f"{type(e).__name__}: {e}"
+            latencies.append(time.perf_counter() - started)
+            if error:
+                errors.append(error)
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=args.request_timeout) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(user(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    return {
+        "scenario": scenario,
+        "concurrency": concurrency,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "rps": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000
+    }
+
+
+def regressions(results: list, baseline_path: str, tolerance: float) -> list:
+    with open(baseline_path) as f:
+        baseline = {(r["scenario"], r["concurrency"]): r for r in json.load(f)}
+    found = []
+    for result in results:
+        before = baseline.get((result["scenario"], result["concurrency"]))
+        if not before:
+            continue
+        if result["p95_ms"] > before["p95_ms"] * (1 + tolerance):
+            found.append(f"{result['scenario']} x{result['concurrency']}: p95 "
+                         f"{before['p95_ms']:.0f} -> {result['p95_ms']:.0f} ms")
+        if result["rps"] < before["rps"] * (1 - tolerance):
+            found.append(f"{result['scenario']} x{result['concurrency']}: rps "
+                         f"{before['rps']:.1f} -> {result['rps']:.1f}")
+    return found
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16])
+    parser.add_argument("--duration", type=float, default=10, help="seconds per scenario and concurrency level")
+    parser.add_argument("--request-timeout", type=float, default=120)
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--gmail-port", type=int, default=9101)
+    parser.add_argument("--openai-port", type=int, default=9102)
+    parser.add_argument("--messages", type=int, default=200)
+    parser.add_argument("--pdf-pages", type=int, default=5)
+    parser.add_argument("--gmail-latency-ms", type=float, default=50)
+    parser.add_argument("--openai-latency-ms", type=float, default=300)
+    parser.add_argument("--token-ms", type=float, default=2)
+    parser.add_argument("--completion-tokens", type=int, default=120)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="injected by both stand-ins")
+    parser.add_argument("--attachments", choices=["inline", "refs"], default="inline")
+    parser.add_argument("--allow-cache", action="store_true", help="let repeated requests hit the reply cache")
+    parser.add_argument("--real-limits", action="store_true", help="keep the app's OpenAI/Gmail rate limits")
+    parser.add_argument("--json", help="write results to this file")
+    parser.add_argument("--baseline", help="earlier --json output to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    processes = [
+        start(["-m", "benchmarks.fake_gmail", "--port", str(args.gmail_port), "--messages", str(args.messages),
+               "--pdf-pages", str(args.pdf_pages), "--latency-ms", str(args.gmail_latency_ms),
+               "--error-rate", str(args.error_rate)]),
+        start(["-m", "benchmarks.fake_openai", "--port", str(args.openai_port),
+               "--latency-ms", str(args.openai_latency_ms), "--token-ms", str(args.token_ms),
+               "--completion-tokens", str(args.completion_tokens), "--error-rate", str(args.error_rate)]),
+    ]
+    try:
+        wait_for(f"http://127.0.0.1:{args.gmail_port}/gmail/v1/users/me/profile", 30)
+        wait_for(f"http://127.0.0.1:{args.openai_port}/v1/models", 30)
+        processes.append(start(["-m", "uvicorn", "main:app", "--port", str(args.port), "--log-level", "warning"],
+                               env=worker_env(args), quiet=True))
+        base_url = f"http://127.0.0.1:{args.port}"
+        wait_for(f"{base_url}/ready", 120)
+
+        # One untimed request per scenario: the first /emails pays for the full mailbox sync
+        with httpx.Client(base_url=base_url, timeout=args.request_timeout) as client:
+            for scenario in args.scenarios:
+                client.request(**build_request(scenario, args))
+
+        results = []
+        print(f"{'scenario':<18} {'conc':>5} {'reqs':>6} {'errors':>6} {'rps':>8} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8}")
+        for scenario in args.scenarios:
+            for concurrency in args.concurrency:
+                result = asyncio.run(run_level(base_url, scenario, concurrency, args))
+                results.append(result)
+                print(f"{scenario:<18} {concurrency:>5} {result['requests']:>6} {result['errors']:>6} "
+                      f"{result['rps']:>8.1f} {result['p50_ms']:>8.0f} {result['p95_ms']:>8.0f} {result['p99_ms']:>8.0f}")
+                if result["first_error"]:
+                    print(f"{'':<18} first error: {result['first_error']}")
+    finally:
+        for process in processes:
+            process.terminate()
+            process.wait()
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+    if args.baseline:
+        found = regressions(results, args.baseline, args.tolerance)
+        for line in found:
+            print(f"REGRESSION {line}")
+        if found:
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Benchmark PDF extraction on synthetic multi-hundred-page documents.
+
+Compares the original serial `text += page.get_text()` loop with the sharded
+process-pool engine in pdf_engine, with and without a word budget.
+
+    cd backend
+    python -m benchmarks.bench_pdf_extract --pages 100 300 600 --workers 4
+"""
+import os
+import time
+import asyncio
+import argparse
+
+import fitz  # PyMuPDF
+
+WORDS = ("agreement party obligation payment schedule delivery warranty liability "
+         "termination notice confidential clause amendment invoice renewal").split()
+
+
+def make_pdf(pages: int, words_per_page: int = 450) -> bytes:
+    doc = fitz.open()
+    for p in range(pages):
+        page = doc.new_page()
+        body = " ".join(WORDS[(p + i) % len(WORDS)] for i in range(words_per_page))
+        page.insert_textbox(fitz.Rect(40, 40, 560, 800), f"Section {p + 1}. {body}", fontsize=7)
+    return doc.tobytes()
+
+
+def serial_extract(pdf_bytes: bytes) -> str:
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    text = ""
+    for page in doc:
+        text += page.get_text()
+    return text
+
+
+def timed(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pages", type=int, nargs="+", default=[100, 300, 600])
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 2)
+    parser.add_argument("--shard-pages", type=int, default=16)
+    parser.add_argument("--budget", type=int, default=20000, help="word budget for the early-stop run")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    # Executors read their sizing from the environment at import time
+    os.environ["CPU_WORKERS"] = str(args.workers)
+    import executors
+    from pdf_engine import extract_pdf
+
+    loop = asyncio.new_event_loop()
+
+    def engine(budget):
+        return lambda: loop.run_until_complete(extract_pdf(pdf, word_budget=budget, shard_pages=args.shard_pages))
+
+    print(f"workers={args.workers} shard_pages={args.shard_pages} budget={args.budget}")
+    print(f"{'pages':>6} {'MB':>6} {'serial s':>9} {'engine s':>9} {'speedup':>8} {'budget s':>9} {'pages read':>10}")
+    for pages in args.pages:
+        pdf = make_pdf(pages)
+        # Warm the process pool so worker start-up is not billed to the first run
+        loop.run_until_complete(extract_pdf(pdf, word_budget=1, shard_pages=args.shard_pages))
+
+        serial = timed(lambda: serial_extract(pdf), args.repeat)
+        full = timed(engine(0), args.repeat)
+        budgeted = timed(engine(args.budget), args.repeat)
+        read = loop.run_until_complete(extract_pdf(pdf, word_budget=args.budget))["pages"]
+        print(f"{pages:>6} {len(pdf) / 1e6:>6.1f} {serial:>9.3f} {full:>9.3f} {serial / full:>7.2f}x "
+              f"{budgeted:>9.3f} {read:>10}")
+
+    executors.shutdown()
+    loop.close()
+
+
+if __name__ == "__main__":
+    main()
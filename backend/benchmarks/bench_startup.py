@@ -0,0 +1,104 @@
+"""
+Benchmark cold start of the API worker.
+
+Import mode runs `import main` in fresh interpreters and reports wall time and
+peak RSS. Serve mode starts uvicorn and reports time until the socket answers,
+time until /ready returns 200 and the worker's resident memory at that point.
+
+    cd backend
+    python -m benchmarks.bench_startup --runs 5
+    python -m benchmarks.bench_startup --serve --port 8765
+"""
+import os
+import sys
+import time
+import json
+import argparse
+import tempfile
+import statistics
+import subprocess
+import urllib.error
+import urllib.request
+
+IMPORT_PROBE = (
+    "import time, resource\n"
+    "start = time.perf_counter()\n"
+    "import main\n"
+    "print(time.perf_counter() - start, resource.getrusage(resource.RUSAGE_SELF).ru_maxrss)\n"
+)
+
+
+def worker_env() -> dict:
+    env = dict(os.environ)
+    env.setdefault("OPENAI_API_KEY", "sk-benchmark")
+    # A throwaway cache and no background drafting so runs are comparable
+    env["CACHE_DIR"] = tempfile.mkdtemp(prefix="bench-startup-")
+    env["PREGEN_ENABLED"] = "0"
+    return env
+
+
+def measure_import(runs: int):
+    times, rss = [], []
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", IMPORT_PROBE], env=worker_env(),
+                             capture_output=True, text=True, check=True)
+        seconds, max_rss_kb = out.stdout.split()[-2:]
+        times.append(float(seconds))
+        rss.append(int(max_rss_kb) / 1024)
+    print(f"import main: median {statistics.median(times):.3f}s  min {min(times):.3f}s  "
+          f"peak RSS {statistics.median(rss):.0f} MB  ({runs} runs)")
+
+
+def resident_mb(pid: int) -> float:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) / 1024
+    return float("nan")
+
+
+def measure_serve(port: int, timeout: float):
+    start = time.perf_counter()
+    proc = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "main:app", "--port", str(port), "--log-level", "warning"],
+        env=worker_env()
+    )
+    listening = None
+    try:
+        while time.perf_counter() - start < timeout:
+            try:
+                with urllib.request.urlopen(f"http://127.0.0.1:{port}/ready", timeout=1) as response:
+                    body = json.loads(response.read())
+                    break
+            except urllib.error.HTTPError:
+                # 503: serving, still preloading
+                listening = listening or time.perf_counter() - start
+            except OSError:
+                pass
+            time.sleep(0.02)
+        else:
+            raise SystemExit(f"/ready did not return 200 within {timeout}s")
+        ready = time.perf_counter() - start
+        listening = listening or ready
+        print(f"listening after {listening:.3f}s, ready after {ready:.3f}s "
+              f"(server reports {body['ready_after']}s), RSS {resident_mb(proc.pid):.0f} MB")
+    finally:
+        proc.terminate()
+        proc.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--serve", action="store_true", help="also start uvicorn and time /ready")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args()
+
+    measure_import(args.runs)
+    if args.serve:
+        measure_serve(args.port, args.timeout)
+
+
+if __name__ == "__main__":
+    main()
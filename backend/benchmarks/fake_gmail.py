@@ -0,0 +1,192 @@
+"""
+Local stand-in for the Gmail REST endpoints the backend uses: profile, history,
+messages list/get/send, threads get, attachments get and the batch endpoint.
+Latency, payload sizes and error rate are configurable.
+
+    cd backend
+    python -m benchmarks.fake_gmail --port 9101 --latency-ms 80 --pdf-pages 5
+    GMAIL_API_ENDPOINT=http://127.0.0.1:9101/ GMAIL_ACCESS_TOKEN=bench uvicorn main:app
+"""
+import re
+import json
+import random
+import asyncio
+import argparse
+import base64
+from email.parser import BytesParser
+from email.policy import HTTP
+from urllib.parse import urlsplit, parse_qs
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, Response
+
+app = FastAPI(title="Fake Gmail")
+config = argparse.Namespace(messages=200, thread_size=3, pdf_every=2, pdf_pages=5, snippet_chars=200,
+                            latency_ms=50.0, jitter_ms=20.0, error_rate=0.0, seed=0)
+pdf_cache = {}
+sent = []
+WORDS = ("quarterly budget review meeting schedule proposal contract invoice deadline project "
+         "update team report client delivery agenda draft approval forecast revenue").split()
+
+
+def body_text(seed: int, chars: int) -> str:
+    rng = random.Random(seed)
+    words = []
+    while sum(len(w) + 1 for w in words) < chars:
+        words.append(rng.choice(WORDS))
+    return " ".join(words).capitalize() + "."
+
+
+def thread_pdf(thread: int) -> bytes:
+    """A distinct multi-page PDF per thread, built once"""
+    if thread not in pdf_cache:
+        import fitz
+        doc = fitz.open()
+        for page in range(config.pdf_pages):
+            doc.new_page().insert_textbox(fitz.Rect(50, 50, 550, 800), body_text(thread * 1000 + page, 2500))
+        pdf_cache[thread] = doc.tobytes()
+    return pdf_cache[thread]
+
+
+def message(i: int, fmt: str) -> dict:
+    thread = i // config.thread_size
+    mid = f"m{i:05d}"
+    text = body_text(i, config.snippet_chars)
+    parts = [{"mimeType": "text/plain", "filename": "", "body": {"size": len(text)}}]
+    if fmt == "full":
+        parts[0]["body"]["data"] = base64.urlsafe_b64encode(text.encode()).decode()
+    if config.pdf_every and i % config.pdf_every == 0:
+        parts.append({"mimeType": "application/pdf", "filename": f"report-{thread}.pdf",
+                      "body": {"attachmentId": f"att-{mid}", "size": len(thread_pdf(thread))}})
+    payload = {
+        "mimeType": "multipart/mixed",
+        "headers": [{"name": "Subject", "value": f"Thread {thread}"},
+                    {"name": "From", "value": f"sender{thread % 17}@example.com"},
+                    {"name": "Date", "value": "Mon, 1 Jan 2024 10:00:00 +0000"}]
+    }
+    # Like Gmail, format=metadata carries headers only, no part tree
+    if fmt != "metadata":
+        payload["parts"] = parts
+    return {
+        "id": mid,
+        "threadId": f"t{thread:05d}",
+        "labelIds": ["INBOX", "UNREAD"],
+        "snippet": text,
+        "internalDate": str(1700000000000 + i * 60000),
+        "historyId": "1000",
+        "payload": payload
+    }
+
+
+def message_index(mid: str):
+    match = re.fullmatch(r"m(\d{5})", mid)
+    if not match or int(match.group(1)) >= config.messages:
+        return None
+    return int(match.group(1))
+
+
+def not_found(what: str) -> tuple:
+    return 404, {"error": {"code": 404, "message": f"{what} not found", "status": "NOT_FOUND"}}
+
+
+def handle(method: str, path: str, query: dict, body: bytes) -> tuple:
+    """Route one Gmail API call to (status, JSON body)"""
+    if random.random() < config.error_rate:
+        return 503, {"error": {"code": 503, "message": "Backend Error", "status": "UNAVAILABLE"}}
+    path = path.removeprefix("/gmail/v1/users/me")
+    fmt = query.get("format", ["full"])[0]
+
+    if path == "/profile":
+        return 200, {"emailAddress": "bench@example.com", "messagesTotal": config.messages, "historyId": "1000"}
+    if path == "/history":
+        return 200, {"history": [], "historyId": "1000"}
+    if path == "/messages" and method == "GET":
+        start = int(query.get("pageToken", ["0"])[0])
+        size = int(query.get("maxResults", ["100"])[0])
+        ids = range(start, min(start + size, config.messages))
+        result = {"messages": [{"id": f"m{i:05d}", "threadId": f"t{i // config.thread_size:05d}"} for i in ids],
+                  "resultSizeEstimate": config.messages}
+        if start + size < config.messages:
+            result["nextPageToken"] = str(start + size)
+        return 200, result
+    if path == "/messages/send" and method == "POST":
+        sent.append(len(body))
+        return 200, {"id": f"s{len(sent):05d}", "threadId": f"s{len(sent):05d}", "labelIds": ["SENT"]}
+
+    match = re.fullmatch(r"/messages/([^/]+)/attachments/([^/]+)", path)
+    if match:
+        i = message_index(match.group(1))
+        if i is None or match.group(2) != f"att-{match.group(1)}":
+            return not_found("Attachment")
+        data = thread_pdf(i // config.thread_size)
+        return 200, {"size": len(data), "data": base64.urlsafe_b64encode(data).decode()}
+    match = re.fullmatch(r"/messages/([^/]+)", path)
+    if match:
+        i = message_index(match.group(1))
+        return (200, message(i, fmt)) if i is not None else not_found("Message")
+    match = re.fullmatch(r"/threads/t(\d{5})", path)
+    if match:
+        first = int(match.group(1)) * config.thread_size
+        ids = range(first, min(first + config.thread_size, config.messages))
+        if not ids:
+            return not_found("Thread")
+        return 200, {"id": f"t{int(match.group(1)):05d}", "historyId": "1000", "messages": [message(i, fmt) for i in ids]}
+    return not_found(path)
+
+
+async def delay():
+    await asyncio.sleep(max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000)
+
+
+def batch_response(content_type: str, body: bytes) -> Response:
+    """Answer a multipart/mixed batch: each part is an embedded HTTP request"""
+    envelope = BytesParser(policy=HTTP).parsebytes(b"Content-Type: " + content_type.encode() + b"\r\n\r\n" + body)
+    boundary = f"batch_{random.getrandbits(64):016x}"
+    out = []
+    for part in envelope.iter_parts():
+        request = part.get_payload(decode=True)
+        head, _, part_body = request.partition(b"\r\n\r\n")
+        method, target, _ = head.split(b"\r\n", 1)[0].decode().split(" ", 2)
+        url = urlsplit(target)
+        status, payload = handle(method, url.path, parse_qs(url.query), part_body)
+        content_id = part.get("Content-ID", "").strip("<>")
+        out.append(
+            f"--{boundary}\r\nContent-Type: application/http\r\nContent-ID: <response-{content_id}>\r\n\r\n"
+            f"HTTP/1.1 {status} {'OK' if status == 200 else 'Error'}\r\nContent-Type: application/json\r\n\r\n"
+            f"{json.dumps(payload)}\r\n"
+        )
+    out.append(f"--{boundary}--\r\n")
+    return Response("".join(out), media_type=f"multipart/mixed; boundary={boundary}")
+
+
+@app.api_route("/{path:path}", methods=["GET", "POST"])
+async def gmail_api(path: str, request: Request):
+    await delay()
+    body = await request.body()
+    if path in ("batch", "batch/gmail/v1"):
+        return batch_response(request.headers["content-type"], body)
+    status, payload = handle(request.method, "/" + path, parse_qs(request.url.query), body)
+    return JSONResponse(payload, status_code=status)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9101)
+    parser.add_argument("--messages", type=int, default=config.messages)
+    parser.add_argument("--thread-size", type=int, default=config.thread_size)
+    parser.add_argument("--pdf-every", type=int, default=config.pdf_every, help="every Nth message has a PDF (0 = none)")
+    parser.add_argument("--pdf-pages", type=int, default=config.pdf_pages)
+    parser.add_argument("--snippet-chars", type=int, default=config.snippet_chars)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms)
+    parser.add_argument("--jitter-ms", type=float, default=config.jitter_ms)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate)
+    parser.add_argument("--seed", type=int, default=config.seed)
+    args = parser.parse_args()
+    vars(config).update({k: v for k, v in vars(args).items() if k != "port"})
+    random.seed(args.seed)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
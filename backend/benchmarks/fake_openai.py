@@ -0,0 +1,95 @@
+"""
+Local OpenAI-compatible chat-completions server (blocking and streamed) with
+configurable time to first token, per-token delay, completion length and error rate.
+
+    cd backend
+    python -m benchmarks.fake_openai --port 9102 --latency-ms 400 --token-ms 5
+    OPENAI_BASE_URL=http://127.0.0.1:9102/v1 uvicorn main:app
+"""
+import json
+import time
+import random
+import asyncio
+import argparse
+
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+
+app = FastAPI(title="Fake OpenAI")
+config = argparse.Namespace(latency_ms=300.0, jitter_ms=50.0, token_ms=2.0, completion_tokens=120,
+                            error_rate=0.0, error_status=500, seed=0)
+REPLY_WORDS = ("Thanks for the update. I reviewed the attached report and the numbers look right. "
+               "Let's go over the open items in Thursday's meeting and confirm the timeline.").split()
+
+
+def completion_tokens(n: int) -> list:
+    return [(" " if i else "") + REPLY_WORDS[i % len(REPLY_WORDS)] for i in range(n)]
+
+
+def usage(messages: list, completion: int) -> dict:
+    prompt = sum(len(m.get("content") or "") for m in messages) // 4
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+def chunk(body: dict, delta: dict, finish_reason=None) -> str:
+    return "data: " + json.dumps({
+        "id": body["id"], "object": "chat.completion.chunk", "created": body["created"], "model": body["model"],
+        "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+    }) + "\n\n"
+
+
+@app.get("/v1/models")
+async def models():
+    return {"object": "list", "data": [{"id": "gpt-4", "object": "model", "owned_by": "bench"}]}
+
+
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    params = await request.json()
+    if random.random() < config.error_rate:
+        return JSONResponse({"error": {"message": "Injected failure", "type": "server_error"}},
+                            status_code=config.error_status)
+    await asyncio.sleep(max(0.0, config.latency_ms + random.uniform(-config.jitter_ms, config.jitter_ms)) / 1000)
+    tokens = completion_tokens(min(params.get("max_tokens") or config.completion_tokens, config.completion_tokens))
+    base = {"id": f"chatcmpl-{random.getrandbits(48):012x}", "created": int(time.time()),
+            "model": params.get("model", "gpt-4")}
+
+    if not params.get("stream"):
+        await asyncio.sleep(len(tokens) * config.token_ms / 1000)
+        return {**base, "object": "chat.completion",
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(tokens)},
+                             "finish_reason": "stop"}],
+                "usage": usage(params.get("messages", []), len(tokens))}
+
+    async def events():
+        yield chunk(base, {"role": "assistant", "content": ""})
+        for token in tokens:
+            await asyncio.sleep(config.token_ms / 1000)
+            yield chunk(base, {"content": token})
+        yield chunk(base, {}, "stop")
+        if (params.get("stream_options") or {}).get("include_usage"):
+            yield "data: " + json.dumps({**base, "object": "chat.completion.chunk", "choices": [],
+                                         "usage": usage(params.get("messages", []), len(tokens))}) + "\n\n"
+        yield "data: [DONE]\n\n"
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--port", type=int, default=9102)
+    parser.add_argument("--latency-ms", type=float, default=config.latency_ms, help="time to first token")
+    parser.add_argument("--jitter-ms", type=float, default=config.jitter_ms)
+    parser.add_argument("--token-ms", type=float, default=config.token_ms)
+    parser.add_argument("--completion-tokens", type=int, default=config.completion_tokens)
+    parser.add_argument("--error-rate", type=float, default=config.error_rate)
+    parser.add_argument("--error-status", type=int, default=config.error_status, help="e.g. 429 or 500")
+    parser.add_argument("--seed", type=int, default=config.seed)
+    args = parser.parse_args()
+    vars(config).update({k: v for k, v in vars(args).items() if k != "port"})
+    random.seed(args.seed)
+    uvicorn.run(app, host="127.0.0.1", port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+pytest-benchmark suite for extractive summarization on synthetic 10k-500k word documents.
+
+Compares the original per-call TfidfVectorizer refit (with NLTK sentence
+splitting when punkt is installed) against the hashing summarizer, grouped by
+document size. Each result records the mean summary sentence length, which
+shows the long-sentence bias of raw TF-IDF sums.
+
+    cd backend
+    pip install -r requirements-dev.txt
+    python -m pytest benchmarks/test_summarizer_benchmark.py
+    python -m pytest benchmarks/test_summarizer_benchmark.py --benchmark-save=summarizer
+    python -m pytest benchmarks/test_summarizer_benchmark.py --benchmark-compare --benchmark-compare-fail=mean:20%
+"""
+import random
+
+import numpy as np
+import pytest
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+from summarizer import summarize, split_sentences
+
+DOCUMENT_WORDS = (10000, 50000, 100000, 500000)
+MAX_SENTENCES = 10
+
+
+def make_text(words: int, vocabulary: int = 30000, seed: int = 0) -> str:
+    """Sentences of 6-40 words drawn from a Zipf-distributed vocabulary, like real prose"""
+    rng = random.Random(seed)
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    vocab = ["".join(rng.choice(letters) for _ in range(rng.randint(2, 10))) for _ in range(vocabulary)]
+    tokens = rng.choices(vocab, cum_weights=np.cumsum(1 / np.arange(1, vocabulary + 1)), k=words)
+    sentences, i = [], 0
+    while i < len(tokens):
+        length = rng.randint(6, 40)
+        body = " ".join(tokens[i:i + length])
+        sentences.append(body[0].upper() + body[1:] + ".")
+        i += length
+    return " ".join(sentences)
+
+
+def tfidf_refit_summarize(text: str, max_sentences: int = 10) -> str:
+    """The previous pdf_text.summarize_text"""
+    try:
+        from nltk.tokenize import sent_tokenize
+        sentences = sent_tokenize(text)
+    except (ImportError, LookupError):
+        sentences = split_sentences(text)
+    if len(sentences) <= max_sentences:
+        return text
+    vectorizer = TfidfVectorizer(stop_words='english')
+    tfidf_matrix = vectorizer.fit_transform(sentences)
+    sentence_scores = np.array(tfidf_matrix.sum(axis=1)).flatten()
+    top_sentence_indices = sentence_scores.argsort()[-max_sentences:][::-1]
+    return ' '.join(sentences[i] for i in sorted(top_sentence_indices))
+
+
+@pytest.fixture(scope="module")
+def documents():
+    # Warm imports and lazily built tables so the first benchmark is not billed for them
+    warm = make_text(2000)
+    tfidf_refit_summarize(warm, MAX_SENTENCES)
+    summarize(warm, MAX_SENTENCES)
+    return {}
+
+
+def document(documents: dict, words: int) -> str:
+    if words not in documents:
+        documents[words] = make_text(words)
+    return documents[words]
+
+
+def run(benchmark, fn, text: str, words: int) -> str:
+    benchmark.group = f"{words} words"
+    # A few rounds are enough at this size; the 500k refit alone takes seconds
+    summary = benchmark.pedantic(fn, args=(text, MAX_SENTENCES), rounds=3, iterations=1)
+    benchmark.extra_info["words_per_sentence"] = len(summary.split()) / MAX_SENTENCES
+    return summary
+
+
+@pytest.mark.parametrize("words", DOCUMENT_WORDS)
+def test_tfidf_refit(benchmark, documents, words):
+    summary = run(benchmark, tfidf_refit_summarize, document(documents, words), words)
+    assert len(split_sentences(summary)) == MAX_SENTENCES
+
+
+@pytest.mark.parametrize("words", DOCUMENT_WORDS)
+def test_hashing_summarizer(benchmark, documents, words):
+    summary = run(benchmark, summarize, document(documents, words), words)
+    assert len(split_sentences(summary)) == MAX_SENTENCES
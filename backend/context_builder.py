@@ -0,0 +1,178 @@
+import os
+import re
+import hashlib
+import threading
+
+# Total prompt tokens allowed for email and attachment context
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# Shares of the budget for latest message, earlier thread turns and attachment text;
+# whatever a section does not use is handed to the others in that order
+CONTEXT_BUDGET_SHARES = tuple(
+    float(share) for share in os.getenv("CONTEXT_BUDGET_SHARES", "0.4,0.25,0.35").split(",")
+)
+
+# tiktoken BPE files, stored the way tiktoken caches them (named by the SHA-1 of the download URL).
+# Encodings are only ever loaded from here, never downloaded, so the app boots without network access
+TIKTOKEN_CACHE_DIR = os.getenv(
+    "TIKTOKEN_CACHE_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), "tiktoken_cache")
+)
+TIKTOKEN_BLOB_URL = "https://openaipublic.blob.core.windows.net/encodings/{}.tiktoken"
+
+# Fallback when no tokenizer encoding is available locally: words split into
+# pieces of up to four characters plus punctuation, close to BPE counts for English
+_APPROX_TOKEN = re.compile(r"\w{1,4}|[^\w\s]")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+|\n{2,}")
+
+
+def load_encoding(model: str):
+    """tiktoken encoding for model from TIKTOKEN_CACHE_DIR, or None if it is not available there"""
+    try:
+        import tiktoken
+        from tiktoken.model import encoding_name_for_model
+        name = encoding_name_for_model(model)
+    except Exception:
+        # tiktoken missing or unknown model
+        return None
+    blob = hashlib.sha1(TIKTOKEN_BLOB_URL.format(name).encode()).hexdigest()
+    if not os.path.exists(os.path.join(TIKTOKEN_CACHE_DIR, blob)):
+        return None
+    os.environ["TIKTOKEN_CACHE_DIR"] = TIKTOKEN_CACHE_DIR
+    try:
+        return tiktoken.get_encoding(name)
+    except Exception:
+        return None
+
+
+class TokenCounter:
+    """Counts and truncates by model tokens, using tiktoken when its encoding is available locally"""
+
+    def __init__(self, model: str):
+        self.model = model
+        self._encoding = None
+        self._loaded = False
+        self._lock = threading.Lock()
+
+    @property
+    def encoding(self):
+        """Loaded on first use, so importing the app never reads the BPE file"""
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._encoding = load_encoding(self.model)
+                    self._loaded = True
+        return self._encoding
+
+    # Pickled by model name only, so build_context can run in process-pool workers
+    def __getstate__(self):
+        return {"model": self.model}
+
+    def __setstate__(self, state):
+        self.__init__(state["model"])
+
+    def count(self, text: str) -> int:
+        if not text:
+            return 0
+        if self.encoding:
+            return len(self.encoding.encode(text, disallowed_special=()))
+        return len(_APPROX_TOKEN.findall(text))
+
+    def truncate(self, text: str, max_tokens: int) -> str:
+        """Keep the first max_tokens tokens of text"""
+        if max_tokens <= 0:
+            return ""
+        if self.encoding:
+            tokens = self.encoding.encode(text, disallowed_special=())
+            return text if len(tokens) <= max_tokens else self.encoding.decode(tokens[:max_tokens])
+        for i, match in enumerate(_APPROX_TOKEN.finditer(text)):
+            if i == max_tokens:
+                return text[:match.start()].rstrip()
+        return text
+
+
+def split_sentences(text: str) -> list:
+    return [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def allocate(budget: int, needs: list, shares: tuple = CONTEXT_BUDGET_SHARES) -> list:
+    """Split budget across sections by share, then give unused tokens to sections in priority order"""
+    total_share = sum(shares) or 1
+    limits = [min(need, int(budget * share / total_share)) for need, share in zip(needs, shares)]
+    spare = budget - sum(limits)
+    for i, need in enumerate(needs):
+        extra = min(spare, need - limits[i])
+        limits[i] += extra
+        spare -= extra
+    return limits
+
+
+def rank_sentences(sentences: list, query: str):
+    """
+    Score sentences by hashed TF-IDF cosine similarity to the query plus their own
+    importance (summarizer.weigh_sentences); nothing is fitted per call
+    """
+    import numpy as np
+    from sklearn.preprocessing import normalize
+    from summarizer import weigh_sentences
+
+    # The query is weighed as one more sentence so it shares the document's idf
+    matrix, scores = weigh_sentences(sentences + [query])
+    matrix = normalize(matrix)
+    relevance = np.asarray((matrix[:-1] @ matrix[-1].T).todense()).ravel()
+    weight = scores[:-1]
+    if weight.max() > 0:
+        weight = weight / weight.max()
+    return relevance + 0.25 * weight
+
+
+def build_context(counter: TokenCounter, latest: str, turns: list, pdf_text: str = "",
+                  budget: int = CONTEXT_TOKEN_BUDGET) -> dict:
+    """
+    Fit the latest message, earlier thread turns (oldest first) and attachment text into
+    budget tokens. Earlier turns are kept newest first; attachment sentences are kept
+    by score against the latest message and emitted in document order.
+    Returns the trimmed sections and per-section token counts.
+    """
+    turn_tokens = [counter.count(turn) for turn in turns]
+    pdf_sentences = split_sentences(pdf_text)
+    sentence_tokens = [counter.count(s) for s in pdf_sentences]
+    needs = [counter.count(latest), sum(turn_tokens), sum(sentence_tokens)]
+    latest_limit, thread_limit, pdf_limit = allocate(budget, needs)
+
+    latest_text = counter.truncate(latest, latest_limit)
+
+    kept_turns, thread_used = [], 0
+    for turn, tokens in zip(reversed(turns), reversed(turn_tokens)):
+        if thread_used + tokens > thread_limit:
+            break
+        kept_turns.append(turn)
+        thread_used += tokens
+    kept_turns.reverse()
+
+    if needs[2] <= pdf_limit:
+        kept_sentences = list(range(len(pdf_sentences)))
+    else:
+        kept_sentences, pdf_used = [], 0
+        scores = rank_sentences(pdf_sentences, latest)
+        for i in sorted(range(len(pdf_sentences)), key=lambda i: -scores[i]):
+            if pdf_used + sentence_tokens[i] <= pdf_limit:
+                kept_sentences.append(i)
+                pdf_used += sentence_tokens[i]
+        kept_sentences.sort()
+    attachment = pdf_text if len(kept_sentences) == len(pdf_sentences) else " ".join(
+        pdf_sentences[i] for i in kept_sentences
+    )
+
+    return {
+        "latest": latest_text,
+        "turns": kept_turns,
+        "pdf_text": attachment,
+        "tokens": {
+            "latest": counter.count(latest_text),
+            "thread": thread_used,
+            "pdf": sum(sentence_tokens[i] for i in kept_sentences),
+            "budget": budget,
+            "dropped_turns": len(turns) - len(kept_turns),
+            "dropped_pdf_sentences": len(pdf_sentences) - len(kept_sentences),
+            "original": sum(needs)
+        }
+    }
@@ -0,0 +1,125 @@
+import os
+import asyncio
+import contextvars
+import multiprocessing
+from functools import partial
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+# Thread pool for blocking I/O (Gmail, SQLite caches, disk), process pool for CPU work (PDF parsing, summarization, context ranking)
+IO_WORKERS = int(os.getenv("IO_WORKERS", "32"))
+CPU_WORKERS = int(os.getenv("CPU_WORKERS", str(os.cpu_count() or 2)))
+# Calls allowed to wait for a free slot before new ones are rejected
+IO_MAX_QUEUE = int(os.getenv("IO_MAX_QUEUE", "256"))
+CPU_MAX_QUEUE = int(os.getenv("CPU_MAX_QUEUE", "64"))
+# Workers are started with forkserver so they never inherit the parent's open sockets and threads
+CPU_START_METHOD = os.getenv("CPU_START_METHOD", "forkserver")
+
+
+class ExecutorBusy(Exception):
+    """Raised when an executor's wait queue is full"""
+
+
+class BoundedExecutor:
+    """Runs blocking callables off the event loop with a concurrency cap and queue-depth counters"""
+
+    def __init__(self, name: str, factory, max_workers: int, max_queue: int):
+        self.name = name
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self._factory = factory
+        self._executor = None
+        self._semaphore = asyncio.Semaphore(max_workers)
+        self.queued = 0
+        self.active = 0
+        self.completed = 0
+        self.failed = 0
+        self.rejected = 0
+
+    @property
+    def executor(self):
+        if self._executor is None:
+            self._executor = self._factory(self.max_workers)
+        return self._executor
+
+    async def run(self, fn, *args, **kwargs):
+        if self.queued >= self.max_queue:
+            self.rejected += 1
+            raise ExecutorBusy(f"{self.name} executor queue is full ({self.max_queue} waiting)")
+
+        self.queued += 1
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.queued -= 1
+
+        self.active += 1
+        try:
+            loop = asyncio.get_running_loop()
+            result = await loop.run_in_executor(self.executor, partial(fn, *args, **kwargs))
+            self.completed += 1
+            return result
+        except Exception:
+            self.failed += 1
+            raise
+        finally:
+            self.active -= 1
+            self._semaphore.release()
+
+    def stats(self) -> dict:
+        return {
+            "max_workers": self.max_workers,
+            "max_queue": self.max_queue,
+            "active": self.active,
+            "queued": self.queued,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected
+        }
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+
+io_executor = BoundedExecutor(
+    "io",
+    lambda n: ThreadPoolExecutor(max_workers=n, thread_name_prefix="io"),
+    IO_WORKERS,
+    IO_MAX_QUEUE
+)
+
+
+def _process_pool(n: int) -> ProcessPoolExecutor:
+    ctx = multiprocessing.get_context(CPU_START_METHOD)
+    if CPU_START_METHOD == "forkserver":
+        # Import the PDF stack once in the fork server instead of in every worker
+        ctx.set_forkserver_preload(["pdf_text", "fitz", "summarizer"])
+    return ProcessPoolExecutor(max_workers=n, mp_context=ctx)
+
+
+cpu_executor = BoundedExecutor(
+    "cpu",
+    _process_pool,
+    CPU_WORKERS,
+    CPU_MAX_QUEUE
+)
+
+
+async def run_io(fn, *args, **kwargs):
+    """Run a blocking I/O-bound call on the shared thread pool, in the caller's context (request metrics)"""
+    return await io_executor.run(contextvars.copy_context().run, fn, *args, **kwargs)
+
+
+async def run_cpu(fn, *args, **kwargs):
+    """Run a CPU-bound call in the process pool; fn and its arguments must be picklable"""
+    return await cpu_executor.run(fn, *args, **kwargs)
+
+
+def stats() -> dict:
+    return {"io": io_executor.stats(), "cpu": cpu_executor.stats()}
+
+
+def shutdown():
+    io_executor.shutdown()
+    cpu_executor.shutdown()
@@ -0,0 +1,148 @@
+import os
+import base64
+
+# Gmail caps a batch at 100 calls; 50 keeps us clear of per-user rate limits
+GMAIL_BATCH_SIZE = int(os.getenv("GMAIL_BATCH_SIZE", "50"))
+GMAIL_MAX_PAGE_SIZE = 500
+
+# "full" is needed for the MIME part tree (attachments): "metadata" returns only
+# headers. The fields mask keeps body data off the wire in either format.
+GMAIL_LIST_FORMAT = os.getenv("GMAIL_LIST_FORMAT", "full")
+METADATA_HEADERS = ["Subject", "From", "Date"]
+MESSAGE_FIELDS = (
+    "id,threadId,snippet,internalDate,labelIds,"
+    "payload(mimeType,headers,"
+    "parts(filename,mimeType,body/attachmentId,body/size,"
+    "parts(filename,mimeType,body/attachmentId,body/size)))"
+)
+
+
+def get_header(headers: list, name: str, default: str = "") -> str:
+    """Return the first header value matching name (case-insensitive)"""
+    name = name.lower()
+    return next((h["value"] for h in headers if h.get("name", "").lower() == name), default)
+
+
+def find_pdf_parts(payload: dict) -> list:
+    """Collect PDF attachment descriptors from a message payload, including nested parts"""
+    attachments = []
+    for part in payload.get("parts", []) or []:
+        if part.get("filename", "").lower().endswith(".pdf"):
+            attach_id = part.get("body", {}).get("attachmentId")
+            if attach_id:
+                attachments.append({
+                    "id": attach_id,
+                    "filename": part.get("filename", "Unknown.pdf"),
+                    "size": part.get("body", {}).get("size", 0)
+                })
+        if part.get("parts"):
+            attachments.extend(find_pdf_parts(part))
+    return attachments
+
+
+def summarize_message(msg_data: dict) -> dict:
+    """Shape a Gmail message resource into the inbox listing format"""
+    payload = msg_data.get("payload", {})
+    headers = payload.get("headers", [])
+    return {
+        "id": msg_data.get("id"),
+        "subject": get_header(headers, "Subject", "(No Subject)"),
+        "from": get_header(headers, "From", "Unknown"),
+        "snippet": msg_data.get("snippet", ""),
+        "threadId": msg_data.get("threadId"),
+        "internalDate": msg_data.get("internalDate"),
+        "labelIds": msg_data.get("labelIds", []),
+        "attachments": find_pdf_parts(payload)
+    }
+
+
+def list_message_ids(gmail, page_size: int = 5, page_token: str = None,
+                     label_ids: tuple = ("INBOX",), query: str = "is:unread") -> tuple:
+    """List one page of message ids; returns (ids, nextPageToken)"""
+    kwargs = {
+        "userId": "me",
+        "maxResults": max(1, min(page_size, GMAIL_MAX_PAGE_SIZE)),
+    }
+    if label_ids:
+        kwargs["labelIds"] = list(label_ids)
+    if query:
+        kwargs["q"] = query
+    if page_token:
+        kwargs["pageToken"] = page_token
+    results = gmail.execute(gmail.users().messages().list(**kwargs))
+    ids = [m["id"] for m in results.get("messages", [])]
+    return ids, results.get("nextPageToken")
+
+
+def batch_get_messages(gmail, message_ids: list, fmt: str = None,
+                       fields: str = MESSAGE_FIELDS, errors: dict = None) -> list:
+    """
+    Fetch many messages with Gmail batch requests, GMAIL_BATCH_SIZE calls per round trip.
+    Results keep the order of message_ids; messages that failed are returned as None.
+    With errors, failures are recorded there by message id instead of raising when all fail.
+    """
+    fmt = fmt or GMAIL_LIST_FORMAT
+    results = [None] * len(message_ids)
+    failures = {}
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            failures[message_ids[int(request_id)]] = exception
+            return
+        results[int(request_id)] = response
+
+    for start in range(0, len(message_ids), GMAIL_BATCH_SIZE):
+        batch = gmail.new_batch_http_request(callback=callback)
+        for i in range(start, min(start + GMAIL_BATCH_SIZE, len(message_ids))):
+            kwargs = {"userId": "me", "id": message_ids[i], "format": fmt, "fields": fields}
+            if fmt == "metadata":
+                kwargs["metadataHeaders"] = METADATA_HEADERS
+            batch.add(gmail.users().messages().get(**kwargs), request_id=str(i))
+        gmail.execute(batch)
+
+    if errors is not None:
+        errors.update(failures)
+    # Surface a total failure; partial failures just drop those messages
+    elif failures and all(r is None for r in results):
+        raise next(iter(failures.values()))
+    return results
+
+
+def batch_get_threads(gmail, thread_ids: list, fmt: str = "full", fields: str = None,
+                      errors: dict = None) -> list:
+    """Fetch many threads with Gmail batch requests; same ordering and failure rules as batch_get_messages"""
+    results = [None] * len(thread_ids)
+    failures = {}
+
+    def callback(request_id, response, exception):
+        if exception is not None:
+            failures[thread_ids[int(request_id)]] = exception
+            return
+        results[int(request_id)] = response
+
+    for start in range(0, len(thread_ids), GMAIL_BATCH_SIZE):
+        batch = gmail.new_batch_http_request(callback=callback)
+        for i in range(start, min(start + GMAIL_BATCH_SIZE, len(thread_ids))):
+            kwargs = {"userId": "me", "id": thread_ids[i], "format": fmt}
+            if fields:
+                kwargs["fields"] = fields
+            batch.add(gmail.users().threads().get(**kwargs), request_id=str(i))
+        gmail.execute(batch)
+
+    if errors is not None:
+        errors.update(failures)
+    elif failures and all(r is None for r in results):
+        raise next(iter(failures.values()))
+    return results
+
+
+def message_text(payload: dict) -> str:
+    """Decoded text/plain body of a "full" format payload, searching nested parts"""
+    if payload.get("mimeType") == "text/plain" and payload.get("body", {}).get("data"):
+        data = payload["body"]["data"]
+        return base64.urlsafe_b64decode(data + "=" * (-len(data) % 4)).decode("utf-8", errors="replace")
+    for part in payload.get("parts", []) or []:
+        text = message_text(part)
+        if text:
+            return text
+    return ""
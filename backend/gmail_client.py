@@ -0,0 +1,193 @@
+import os
+import json
+import time
+import queue
+import threading
+from contextlib import contextmanager
+
+import metrics
+
+# Number of keep-alive transports shared by all requests in this worker
+GMAIL_HTTP_POOL_SIZE = int(os.getenv("GMAIL_HTTP_POOL_SIZE", "8"))
+GMAIL_HTTP_TIMEOUT = float(os.getenv("GMAIL_HTTP_TIMEOUT", "30"))
+# Transports idle longer than this are rebuilt: the server may have closed their keep-alive sockets
+GMAIL_HTTP_MAX_IDLE = float(os.getenv("GMAIL_HTTP_MAX_IDLE", "30"))
+# Retries (with backoff) for a call that hits a stale socket, a 429 or a 5xx
+GMAIL_HTTP_RETRIES = int(os.getenv("GMAIL_HTTP_RETRIES", "3"))
+# Calls that must not run twice: a timeout or 5xx may come after Gmail already acted on them
+NON_IDEMPOTENT_METHODS = {
+    "gmail.users.messages.send", "gmail.users.messages.insert", "gmail.users.messages.import",
+    "gmail.users.drafts.send"
+}
+# Optional path to a saved gmail.v1 discovery document; defaults to the copy bundled with the client
+GMAIL_DISCOVERY_DOC = os.getenv("GMAIL_DISCOVERY_DOC")
+# Base URL replacing https://gmail.googleapis.com/ (e.g. the local stand-in in benchmarks/fake_gmail.py)
+GMAIL_API_ENDPOINT = os.getenv("GMAIL_API_ENDPOINT")
+
+
+class GmailClientManager:
+    """
+    Long-lived Gmail client: the service is built once from a static discovery
+    document and calls are executed on a pool of authorized keep-alive transports.
+    httplib2 transports are not thread-safe, so each call checks one out exclusively.
+    Transports left idle past max_idle are closed and replaced on checkout.
+    """
+
+    def __init__(self, credentials, pool_size: int = GMAIL_HTTP_POOL_SIZE,
+                 timeout: float = GMAIL_HTTP_TIMEOUT, discovery_doc: str = GMAIL_DISCOVERY_DOC, quota=None,
+                 api_endpoint: str = GMAIL_API_ENDPOINT, max_idle: float = GMAIL_HTTP_MAX_IDLE,
+                 num_retries: int = GMAIL_HTTP_RETRIES):
+        self.credentials = credentials
+        self.api_endpoint = api_endpoint
+        self.quota = quota
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self.num_retries = num_retries
+        self.evicted = 0
+        # (transport, last used at) pairs
+        self._pool = queue.LifoQueue()
+        self._created = 0
+        self._pool_lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._service_lock = threading.Lock()
+        self._service = None
+        self.discovery_doc = discovery_doc
+
+    @property
+    def service(self):
+        """Gmail service, built on first use so importing the app does not parse the discovery document"""
+        if self._service is None:
+            with self._service_lock:
+                if self._service is None:
+                    self._service = self._build_service(self.discovery_doc)
+        return self._service
+
+    def _build_service(self, discovery_doc: str = None):
+        # Imported here, not at module level: the client library is only loaded once Gmail is used
+        import httplib2
+        from googleapiclient.discovery import build, build_from_document
+        from googleapiclient.discovery_cache import get_static_doc
+
+        # The service's own transport is never used for calls; execute() always passes a pooled one
+        if discovery_doc or self.api_endpoint:
+            if discovery_doc:
+                with open(discovery_doc) as f:
+                    document = json.load(f)
+            else:
+                document = json.loads(get_static_doc("gmail", "v1"))
+            if self.api_endpoint:
+                # rootUrl, not client_options: batch requests are sent to rootUrl + batchPath
+                document["rootUrl"] = self.api_endpoint.rstrip("/") + "/"
+            return build_from_document(document, http=httplib2.Http(timeout=self.timeout))
+        return build("gmail", "v1", http=httplib2.Http(timeout=self.timeout),
+                     static_discovery=True, cache_discovery=False)
+
+    def _new_http(self):
+        import httplib2
+        import google_auth_httplib2
+        return google_auth_httplib2.AuthorizedHttp(
+            self.credentials, http=httplib2.Http(timeout=self.timeout)
+        )
+
+    def ensure_fresh_token(self):
+        """Refresh the OAuth token once for the whole worker instead of per transport"""
+        if self.credentials.valid:
+            return
+        with self._refresh_lock:
+            if not self.credentials.valid:
+                import httplib2
+                import google_auth_httplib2
+                self.credentials.refresh(google_auth_httplib2.Request(httplib2.Http(timeout=self.timeout)))
+
+    @contextmanager
+    def http(self):
+        """Check out an authorized transport, creating one if the pool is not yet full"""
+        try:
+            http, last_used = self._pool.get_nowait()
+        except queue.Empty:
+            with self._pool_lock:
+                create = self._created < self.pool_size
+                if create:
+                    self._created += 1
+            http, last_used = (self._new_http(), time.monotonic()) if create else self._pool.get()
+        if time.monotonic() - last_used > self.max_idle:
+            http.close()
+            http = self._new_http()
+            self.evicted += 1
+        try:
+            yield http
+        finally:
+            self._pool.put((http, time.monotonic()))
+
+    def users(self):
+        return self.service.users()
+
+    def new_batch_http_request(self, callback=None):
+        return self.service.new_batch_http_request(callback=callback)
+
+    def with_quota(self, quota) -> "GmailQuotaView":
+        """This client charging a different quota, e.g. the lower-priority budget for background jobs"""
+        return GmailQuotaView(self, quota)
+
+    def execute(self, request, quota=None):
+        """Execute an HttpRequest or BatchHttpRequest on a pooled transport; quota overrides the client's"""
+        quota = quota or self.quota
+        if quota:
+            quota.acquire(request)
+        self.ensure_fresh_token()
+        # users.messages.get -> gmail.messages.get; batches have no methodId
+        method = getattr(request, "methodId", None) or "gmail.batch"
+        with metrics.stage(method.replace("gmail.users.", "gmail.")):
+            if not hasattr(request, "methodId"):
+                return self._execute_batch(request)
+            with self.http() as http:
+                if method in NON_IDEMPOTENT_METHODS:
+                    return self._execute_once(request, http)
+                # Retried inside the client, which reconnects after a dropped socket
+                return request.execute(http=http, num_retries=self.num_retries)
+
+    @staticmethod
+    def _execute_once(request, http):
+        try:
+            return request.execute(http=http)
+        except (BrokenPipeError, ConnectionRefusedError):
+            # The socket was closed before the request was written, so Gmail never saw it
+            http.close()
+            return request.execute(http=http)
+
+    def _execute_batch(self, batch):
+        # BatchHttpRequest.execute takes no num_retries; retry a dropped connection on a fresh transport
+        for attempt in range(self.num_retries + 1):
+            with self.http() as http:
+                try:
+                    return batch.execute(http=http)
+                except ConnectionError:
+                    http.close()
+                    if attempt == self.num_retries:
+                        raise
+
+    def stats(self) -> dict:
+        return {
+            "pool_size": self.pool_size,
+            "transports": self._created,
+            "idle": self._pool.qsize(),
+            "evicted": self.evicted
+        }
+
+
+class GmailQuotaView:
+    """Shares a GmailClientManager's service and transports but charges its own quota"""
+
+    def __init__(self, client: GmailClientManager, quota):
+        self.client = client
+        self.quota = quota
+
+    def users(self):
+        return self.client.users()
+
+    def new_batch_http_request(self, callback=None):
+        return self.client.new_batch_http_request(callback=callback)
+
+    def execute(self, request):
+        return self.client.execute(request, quota=self.quota)
@@ -0,0 +1,158 @@
+import os
+import random
+import asyncio
+import threading
+
+import metrics
+from rate_limit import estimate_tokens
+
+# Total and connect timeouts for one completion call (seconds)
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_CONNECT_TIMEOUT = float(os.getenv("LLM_CONNECT_TIMEOUT", "5"))
+# Keep-alive connections shared by every generation in this worker; callers beyond
+# that wait up to LLM_POOL_TIMEOUT for a free connection instead of opening more
+LLM_MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "16"))
+LLM_POOL_TIMEOUT = float(os.getenv("LLM_POOL_TIMEOUT", "60"))
+# HTTP/2 multiplexes concurrent calls over one connection; needs the h2 package
+LLM_HTTP2 = os.getenv("LLM_HTTP2", "1") == "1"
+# Retries on 408/409/429/5xx and connection errors, with full-jitter exponential backoff
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_BACKOFF_BASE = float(os.getenv("LLM_BACKOFF_BASE", "0.5"))
+LLM_BACKOFF_MAX = float(os.getenv("LLM_BACKOFF_MAX", "20"))
+
+RETRY_STATUSES = {408, 409, 429}
+
+
+def retryable(error: Exception) -> bool:
+    import openai
+    # APITimeoutError is a connection error
+    if isinstance(error, openai.APIConnectionError):
+        return True
+    return isinstance(error, openai.APIStatusError) and (
+        error.status_code in RETRY_STATUSES or error.status_code >= 500
+    )
+
+
+def backoff(attempt: int, error: Exception) -> float:
+    """Seconds to wait before retry attempt + 1: the server's Retry-After if given, else full jitter"""
+    import openai
+    if isinstance(error, openai.APIStatusError):
+        try:
+            return min(float(error.response.headers.get("retry-after", "")), LLM_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(LLM_BACKOFF_MAX, LLM_BACKOFF_BASE * 2 ** attempt))
+
+
+class LLMGateway:
+    """
+    Every chat completion in the worker goes through one AsyncOpenAI client on a shared
+    keep-alive connection pool, so concurrent generations cost no threads and few
+    connections. Adds rate limiting, a single timeout/retry policy (the SDK's own
+    retries are off) and token accounting from each response's usage.
+    """
+
+    def __init__(self, model: str, api_key: str = None, base_url: str = None, limiter=None,
+                 max_retries: int = LLM_MAX_RETRIES):
+        self.model = model
+        self.api_key = api_key
+        self.base_url = base_url
+        self.limiter = limiter
+        self.max_retries = max_retries
+        self._client = None
+        self._lock = threading.Lock()
+        self.calls = 0
+        self.retries = 0
+        self.failures = 0
+        self.tokens = {}
+
+    @property
+    def client(self):
+        """AsyncOpenAI client, built on first use so importing the app never loads openai/httpx"""
+        if self._client is None:
+            import httpx
+            from openai import AsyncOpenAI
+            http2 = LLM_HTTP2
+            try:
+                import h2  # noqa: F401
+            except ImportError:
+                http2 = False
+            timeout = httpx.Timeout(LLM_TIMEOUT, connect=LLM_CONNECT_TIMEOUT, pool=LLM_POOL_TIMEOUT)
+            http_client = httpx.AsyncClient(
+                http2=http2,
+                timeout=timeout,
+                limits=httpx.Limits(max_connections=LLM_MAX_CONNECTIONS, max_keepalive_connections=LLM_MAX_CONNECTIONS)
+            )
+            self._client = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url, http_client=http_client,
+                                       timeout=timeout, max_retries=0)
+        return self._client
+
+    def _record(self, agent: str, prompt_tokens: int, completion_tokens: int):
+        with self._lock:
+            totals = self.tokens.setdefault(agent, {"calls": 0, "prompt": 0, "completion": 0})
+            totals["calls"] += 1
+            totals["prompt"] += prompt_tokens
+            totals["completion"] += completion_tokens
+        metrics.record_tokens(agent, prompt_tokens, completion_tokens)
+
+    async def _create(self, system_message: str, prompt: str, **kwargs):
+        """One create call with retries; returns the response (or the stream, once opened)"""
+        for attempt in range(self.max_retries + 1):
+            if self.limiter:
+                await self.limiter.acquire_async(system_message + prompt)
+            self.calls += 1
+            try:
+                return await self.client.chat.completions.create(
+                    model=self.model,
+                    messages=[
+                        {"role": "system", "content": system_message},
+                        {"role": "user", "content": prompt}
+                    ],
+                    **kwargs
+                )
+            except Exception as e:
+                if attempt == self.max_retries or not retryable(e):
+                    self.failures += 1
+                    raise
+                self.retries += 1
+                await asyncio.sleep(backoff(attempt, e))
+
+    async def complete(self, system_message: str, prompt: str, agent: str) -> str:
+        """Reply text of one completion; agent names the pass in metrics"""
+        with metrics.stage(agent):
+            response = await self._create(system_message, prompt)
+        content = response.choices[0].message.content or ""
+        usage = response.usage
+        self._record(agent, usage.prompt_tokens if usage else estimate_tokens(system_message + prompt),
+                     usage.completion_tokens if usage else estimate_tokens(content))
+        return content
+
+    async def stream(self, system_message: str, prompt: str, agent: str):
+        """
+        Yield content tokens of a streamed completion. Retries cover opening the stream;
+        a failure after tokens were yielded is raised to the caller.
+        """
+        parts, usage = [], None
+        with metrics.stage(agent):
+            stream = await self._create(system_message, prompt, stream=True,
+                                        stream_options={"include_usage": True})
+            async for chunk in stream:
+                # The final chunk carries usage and no choices
+                if chunk.usage:
+                    usage = chunk.usage
+                if chunk.choices and chunk.choices[0].delta.content:
+                    parts.append(chunk.choices[0].delta.content)
+                    yield chunk.choices[0].delta.content
+        self._record(agent, usage.prompt_tokens if usage else estimate_tokens(system_message + prompt),
+                     usage.completion_tokens if usage else estimate_tokens("".join(parts)))
+
+    def stats(self) -> dict:
+        with self._lock:
+            tokens = {agent: dict(totals) for agent, totals in self.tokens.items()}
+        return {"calls": self.calls, "retries": self.retries, "failures": self.failures,
+                "max_connections": LLM_MAX_CONNECTIONS, "tokens": tokens}
+
+    async def aclose(self):
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
@@ -0,0 +1,265 @@
+import os
+import json
+import time
+import sqlite3
+import threading
+
+from googleapiclient.errors import HttpError
+
+from reply_cache import CACHE_DIR
+from gmail_batch import (
+    list_message_ids, batch_get_messages, summarize_message,
+    GMAIL_MAX_PAGE_SIZE, GMAIL_LIST_FORMAT, METADATA_HEADERS, MESSAGE_FIELDS
+)
+
+MAILBOX_DB_PATH = os.getenv("MAILBOX_DB_PATH", os.path.join(CACHE_DIR, "mailbox.sqlite3"))
+# Window mirrored by a full resync; threads need sent mail too, so no label filter is applied
+MAILBOX_SYNC_QUERY = os.getenv("MAILBOX_SYNC_QUERY", "newer_than:90d")
+MAILBOX_FULL_SYNC_LIMIT = int(os.getenv("MAILBOX_FULL_SYNC_LIMIT", "2000"))
+# Minimum seconds between incremental syncs triggered by requests
+MAILBOX_SYNC_INTERVAL = float(os.getenv("MAILBOX_SYNC_INTERVAL", "15"))
+# Extra rounds for messages whose batch part failed (e.g. a 429 inside the batch)
+MAILBOX_FETCH_RETRIES = int(os.getenv("MAILBOX_FETCH_RETRIES", "3"))
+
+
+class MailboxStore:
+    """
+    Local SQLite mirror of message metadata, thread membership and attachment
+    descriptors. Kept current from Gmail's history API starting at the last
+    stored historyId, with a full resync when that history has expired.
+    """
+
+    def __init__(self, gmail, path: str = MAILBOX_DB_PATH):
+        self.gmail = gmail
+        self._lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self.last_sync = 0.0
+        self.full_syncs = 0
+        self.incremental_syncs = 0
+        self.messages_fetched = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS messages ("
+            "id TEXT PRIMARY KEY, thread_id TEXT, subject TEXT, sender TEXT, snippet TEXT, "
+            "internal_date INTEGER, label_ids TEXT, attachments TEXT)"
+        )
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_thread ON messages (thread_id, internal_date)")
+        self._db.execute("CREATE INDEX IF NOT EXISTS messages_date ON messages (internal_date)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+
+    # Storage
+
+    def _get_state(self, key: str):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+            self._db.commit()
+
+    def upsert_messages(self, messages: list):
+        rows = []
+        for m in messages:
+            if not m:
+                continue
+            data = summarize_message(m)
+            rows.append((
+                data["id"], data["threadId"], data["subject"], data["from"], data["snippet"],
+                int(data["internalDate"] or 0), json.dumps(data["labelIds"]), json.dumps(data["attachments"])
+            ))
+        with self._lock:
+            self._db.executemany(
+                "INSERT OR REPLACE INTO messages "
+                "(id, thread_id, subject, sender, snippet, internal_date, label_ids, attachments) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", rows
+            )
+            self._db.commit()
+
+    def _set_labels(self, message_id: str, label_ids: list):
+        with self._lock:
+            self._db.execute("UPDATE messages SET label_ids = ? WHERE id = ?", (json.dumps(label_ids), message_id))
+            self._db.commit()
+
+    def _delete(self, message_ids: list):
+        with self._lock:
+            self._db.executemany("DELETE FROM messages WHERE id = ?", [(i,) for i in message_ids])
+            self._db.commit()
+
+    @staticmethod
+    def _row_to_message(row) -> dict:
+        return {
+            "id": row[0],
+            "threadId": row[1],
+            "subject": row[2],
+            "from": row[3],
+            "snippet": row[4],
+            "internalDate": str(row[5]),
+            "labelIds": json.loads(row[6]),
+            "attachments": json.loads(row[7])
+        }
+
+    _COLUMNS = "id, thread_id, subject, sender, snippet, internal_date, label_ids, attachments"
+
+    def get_message(self, message_id: str):
+        with self._lock:
+            row = self._db.execute(f"SELECT {self._COLUMNS} FROM messages WHERE id = ?", (message_id,)).fetchone()
+        return self._row_to_message(row) if row else None
+
+    def get_thread(self, thread_id: str) -> list:
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {self._COLUMNS} FROM messages WHERE thread_id = ? ORDER BY internal_date", (thread_id,)
+            ).fetchall()
+        return [self._row_to_message(r) for r in rows]
+
+    def list_unread(self, page_size: int = 5, page_token: str = None) -> dict:
+        """Unread inbox messages, newest first; page_token is an offset into that ordering"""
+        offset = int(page_token or 0)
+        with self._lock:
+            rows = self._db.execute(
+                f"SELECT {self._COLUMNS} FROM messages "
+                "WHERE label_ids LIKE '%\"INBOX\"%' AND label_ids LIKE '%\"UNREAD\"%' "
+                "ORDER BY internal_date DESC LIMIT ? OFFSET ?",
+                (page_size + 1, offset)
+            ).fetchall()
+        return {
+            "emails": [self._row_to_message(r) for r in rows[:page_size]],
+            "nextPageToken": str(offset + page_size) if len(rows) > page_size else None
+        }
+
+    def unread_thread_heads(self, limit: int) -> list:
+        """[(message_id, internal_date, latest message id in its thread)] for the newest unread messages"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT m.id, m.internal_date, "
+                "(SELECT t.id FROM messages t WHERE t.thread_id = m.thread_id "
+                " ORDER BY t.internal_date DESC LIMIT 1) "
+                "FROM messages m "
+                "WHERE m.label_ids LIKE '%\"INBOX\"%' AND m.label_ids LIKE '%\"UNREAD\"%' "
+                "ORDER BY m.internal_date DESC LIMIT ?", (limit,)
+            ).fetchall()
+
+    # Sync
+
+    def _fetch_into_store(self, message_ids: list):
+        """
+        Fetch and store messages, retrying the ones whose batch part failed. Raises if any
+        still fail, so callers do not advance history_id past messages the mirror lacks.
+        """
+        pending = list(message_ids)
+        for attempt in range(MAILBOX_FETCH_RETRIES + 1):
+            if attempt:
+                time.sleep(2 ** (attempt - 1))
+            failed = {}
+            for start in range(0, len(pending), GMAIL_MAX_PAGE_SIZE):
+                chunk = pending[start:start + GMAIL_MAX_PAGE_SIZE]
+                self.upsert_messages(batch_get_messages(self.gmail, chunk, errors=failed))
+                self.messages_fetched += len(chunk)
+            # A 404 means the message was deleted after it was listed: nothing to store
+            pending = [message_id for message_id, error in failed.items()
+                       if not (isinstance(error, HttpError) and error.resp.status == 404)]
+            if not pending:
+                return
+        raise failed[pending[0]]
+
+    def fetch_thread(self, thread_id: str) -> list:
+        """Pull one thread straight from Gmail into the store (for threads outside the synced window)"""
+        kwargs = {"userId": "me", "id": thread_id, "format": GMAIL_LIST_FORMAT,
+                  "fields": f"messages({MESSAGE_FIELDS})"}
+        if GMAIL_LIST_FORMAT == "metadata":
+            kwargs["metadataHeaders"] = METADATA_HEADERS
+        thread = self.gmail.execute(self.gmail.users().threads().get(**kwargs))
+        self.upsert_messages(thread.get("messages", []))
+        self.messages_fetched += len(thread.get("messages", []))
+        return self.get_thread(thread_id)
+
+    def fetch_message(self, message_id: str):
+        """Pull one message straight from Gmail into the store"""
+        self.upsert_messages(batch_get_messages(self.gmail, [message_id]))
+        self.messages_fetched += 1
+        return self.get_message(message_id)
+
+    def full_sync(self):
+        """Rebuild the mirror for MAILBOX_SYNC_QUERY and record the historyId to continue from"""
+        # Take the historyId first so changes made during the listing are replayed next sync
+        history_id = self.gmail.execute(self.gmail.users().getProfile(userId="me"))["historyId"]
+        ids, page_token = [], None
+        while len(ids) < MAILBOX_FULL_SYNC_LIMIT:
+            page, page_token = list_message_ids(
+                self.gmail, GMAIL_MAX_PAGE_SIZE, page_token, label_ids=None, query=MAILBOX_SYNC_QUERY
+            )
+            ids.extend(page)
+            if not page_token:
+                break
+        with self._lock:
+            self._db.execute("DELETE FROM messages")
+            self._db.commit()
+        self._fetch_into_store(ids[:MAILBOX_FULL_SYNC_LIMIT])
+        self._set_state("history_id", str(history_id))
+        self.full_syncs += 1
+
+    def incremental_sync(self, history_id: str):
+        """Apply history records since history_id; raises HttpError 404 when the history has expired"""
+        added, deleted = set(), set()
+        page_token, latest = None, history_id
+        while True:
+            kwargs = {"userId": "me", "startHistoryId": history_id, "maxResults": GMAIL_MAX_PAGE_SIZE}
+            if page_token:
+                kwargs["pageToken"] = page_token
+            response = self.gmail.execute(self.gmail.users().history().list(**kwargs))
+            for record in response.get("history", []):
+                for item in record.get("messagesAdded", []):
+                    added.add(item["message"]["id"])
+                for item in record.get("messagesDeleted", []):
+                    deleted.add(item["message"]["id"])
+                for item in record.get("labelsAdded", []) + record.get("labelsRemoved", []):
+                    message = item["message"]
+                    if message["id"] not in added:
+                        self._set_labels(message["id"], message.get("labelIds", []))
+            latest = response.get("historyId", latest)
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+
+        self._delete(list(deleted))
+        self._fetch_into_store(list(added - deleted))
+        self._set_state("history_id", str(latest))
+        self.incremental_syncs += 1
+
+    def sync(self, force: bool = False):
+        """Bring the mirror up to date; cheap when called often thanks to MAILBOX_SYNC_INTERVAL"""
+        if not force and time.time() - self.last_sync < MAILBOX_SYNC_INTERVAL:
+            return
+        with self._sync_lock:
+            if not force and time.time() - self.last_sync < MAILBOX_SYNC_INTERVAL:
+                return
+            history_id = self._get_state("history_id")
+            if history_id is None:
+                self.full_sync()
+            else:
+                try:
+                    self.incremental_sync(history_id)
+                except HttpError as e:
+                    if e.resp.status != 404:
+                        raise
+                    self.full_sync()
+            self.last_sync = time.time()
+
+    def stats(self) -> dict:
+        with self._lock:
+            count = self._db.execute("SELECT COUNT(*) FROM messages").fetchone()[0]
+        return {
+            "messages": count,
+            "history_id": self._get_state("history_id"),
+            "last_sync": self.last_sync,
+            "full_syncs": self.full_syncs,
+            "incremental_syncs": self.incremental_syncs,
+            "messages_fetched": self.messages_fetched
+        }
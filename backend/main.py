@@ -1,27 +1,44 @@
 import os
+import time
+import logging
+import hashlib
+import importlib
+import asyncio
 import base64
-import fitz  # PyMuPDF
 from dotenv import load_dotenv
 from fastapi import FastAPI, UploadFile, File, Form, Request, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-from openai import OpenAI
+from fastapi.responses import StreamingResponse, JSONResponse, FileResponse, Response
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
 import base64 as b64
 from pydantic import BaseModel
-from typing import Optional
-from autogen import AssistantAgent, UserProxyAgent
+from typing import Optional, List
 import uvicorn
-from sklearn.feature_extraction.text import TfidfVectorizer
-import numpy as np
-import nltk
-from nltk.tokenize import sent_tokenize
+import executors
+import metrics
+from executors import run_io, run_cpu
+from pdf_engine import extract_pdf_text, PDF_OCR_ENABLED, PDF_OCR_DPI, PDF_MAX_CONCURRENT_DOCS
+from mailbox_store import MailboxStore
+from pregen import PregenWorker, PREGEN_ENABLED, PREGEN_MAX_MESSAGES
+from llm_gateway import LLMGateway
+from sse import SSE_HEADERS, sse_event, stream_pass
+from style_check import check_style
+from reply_cache import ReplyCache, reply_cache_key
+from attachment_store import AttachmentStore, SingleFlight
+from gmail_client import GmailClientManager
+from rate_limit import openai_limiter, gmail_quota, gmail_background_quota
+from batch_jobs import BatchJobManager, BATCH_MAX_ITEMS
+from context_builder import TokenCounter, build_context
+from style_examples import StyleExampleIndex, format_examples, STYLE_EXAMPLES_K
+from sent_corpus import SentCorpus, SENT_CORPUS_ENABLED, SENT_CORPUS_INTERVAL
+from response_metrics import CompressionMiddleware, json_response, response_metrics
+
+logger = logging.getLogger(__name__)
 
 
 # Load .env variables
 load_dotenv()
 api_key = os.getenv("OPENAI_API_KEY")
-client = OpenAI(api_key=api_key)
 
 # Gmail API Setup
 gmail_token = os.getenv("GMAIL_ACCESS_TOKEN")
@@ -38,6 +55,9 @@ gmail_creds = Credentials(
     scopes=["https://www.googleapis.com/auth/gmail.modify"]
 )
 
+# Shared Gmail client: built once, calls run on pooled keep-alive transports, paced to the quota
+gmail = GmailClientManager(gmail_creds, quota=gmail_quota)
+
 app = FastAPI(title="Email Assistant API")
 
 # Enable CORS for frontend
@@ -48,8 +68,12 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# gzip/brotli for large JSON bodies; attachment files and event streams are left as-is
+app.add_middleware(CompressionMiddleware)
+# Outermost: latency per route, in-flight requests and the Server-Timing header
+app.add_middleware(metrics.MetricsMiddleware)
 
-# Configuration for AutoGen agents
+# LLM configuration
 CONFIG = {
     "model": "gpt-4",
     "api_key": os.getenv("OPENAI_API_KEY")
@@ -65,109 +89,221 @@ USER_STYLE = {
     # "key_phrases": ["I hope this helps", "Let me know if you have any questions"]
 }
 
-# Initialize Agents
-writer_agent = AssistantAgent(
-    name="WriterAgent",
-    system_message="""You are an email response generator. Create a professional reply to the given email.
+# Agent system messages (shared by the blocking and streaming generation paths)
+WRITER_SYSTEM_MESSAGE = """You are an email response generator. Create a professional reply to the given email.
     Focus on:
     - Accurate content response
     - Clear communication
     - Appropriate level of detail
-    Don't worry about specific styling - that will be handled separately.""",
-    llm_config={"config_list": [CONFIG]}
-)
+    Don't worry about specific styling - that will be handled separately."""
 
-review_agent = AssistantAgent(
-    name="ReviewAgent",
-    system_message=f"""You are a draft email improver. Rewrite the email draft to perfectly match these style guidelines:
+# Adaptive-mode writer: also follows the rules check_style verifies, so a conforming
+# draft can skip the review pass
+ADAPTIVE_WRITER_SYSTEM_MESSAGE = f"""You are an email response generator. Create a reply to the given email.
+    Focus on:
+    - Accurate content response
+    - Clear communication
+    - A {USER_STYLE["tone"]} tone, opening with a short greeting to the sender
+    - Keeping it {USER_STYLE["length"]}
+    - No template placeholders like [Your Name]
+    End the email with exactly this signature:
+    {USER_STYLE["preferred_signature"]}
+    Return ONLY the email (no commentary)."""
+
+REVIEW_SYSTEM_MESSAGE = f"""You are a draft email improver. Rewrite the email draft to perfectly match these style guidelines:
     {USER_STYLE}
     Your output should:
     1. Maintain all original content meaning
     2. Apply all style rules exactly
     3. Return ONLY the final version (no commentary)
-    """,
-    llm_config={"config_list": [CONFIG]}
-)
-
-user_proxy = UserProxyAgent(
-    name="UserProxy",
-    human_input_mode="NEVER",
-    max_consecutive_auto_reply=0,
-    code_execution_config=False
-)
-
-nltk.download('punkt')
-
-def summarize_text(text: str, max_sentences: int = 10) -> str:
-    """
-    Simple extractive summarization using TF-IDF and sentence importance scoring
     """
-    sentences = sent_tokenize(text)
-    if len(sentences) <= max_sentences:
-        return text  # No need to summarize if already short
-    
-    # Create TF-IDF matrix
-    vectorizer = TfidfVectorizer(stop_words='english')
-    tfidf_matrix = vectorizer.fit_transform(sentences)
-    
-    # Calculate sentence importance scores
-    sentence_scores = np.array(tfidf_matrix.sum(axis=1)).flatten()
-    
-    # Get top N sentences
-    top_sentence_indices = sentence_scores.argsort()[-max_sentences:][::-1]
-    top_sentences = [sentences[i] for i in sorted(top_sentence_indices)]
-    
-    return ' '.join(top_sentences)
-
-def extract_text_from_pdf(pdf_bytes: bytes) -> str:
-    """Extract text from PDF with optional summarization for long documents"""
-    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
-    text = ""
-    for page in doc:
-        text += page.get_text()
-    text = text.strip()
-    
-    # Simple word count check (approximate)
-    word_count = len(text.split())
-    if word_count > 1000:
-        return summarize_text(text)
-    return text
 
+# Single-pass prompt for "fast" mode: content and style in one completion
+FAST_SYSTEM_MESSAGE = f"""You are an email response generator. Create a reply to the given email that matches these style guidelines:
+    {USER_STYLE}
+    Focus on:
+    - Accurate content response
+    - Clear communication
+    - Applying all style rules exactly
+    Return ONLY the final email (no commentary)."""
+
+# Generation modes: two_pass = writer then review, fast = one fused call,
+# adaptive = writer, then review only if the local style check fails
+GENERATION_MODES = ("two_pass", "fast", "adaptive")
+DEFAULT_GENERATION_MODE = os.getenv("GENERATION_MODE", "two_pass")
+
+# Every completion goes through one async client on a shared keep-alive pool; each call is a
+# fresh two-message chat, so concurrent requests never share conversation state
+llm = LLMGateway(CONFIG["model"], api_key=api_key, base_url=os.getenv("OPENAI_BASE_URL"), limiter=openai_limiter)
+
+# Generated replies keyed by a hash of everything that shapes them
+reply_cache = ReplyCache()
+
+# Few-shot examples from email_style_examples.json, retrieved per email
+style_index = StyleExampleIndex()
+
+def reply_key(email_content: str, pdf_text: str, mode: str) -> str:
+    """Cache key of a reply; may load the style examples file, so call it through run_io"""
+    return reply_cache_key(
+        email_content, pdf_text, mode, USER_STYLE, CONFIG["model"],
+        WRITER_SYSTEM_MESSAGE, ADAPTIVE_WRITER_SYSTEM_MESSAGE, REVIEW_SYSTEM_MESSAGE, FAST_SYSTEM_MESSAGE,
+        style_index.load().version
+    )
+
+# Prompt context is trimmed to CONTEXT_TOKEN_BUDGET model tokens before generation
+token_counter = TokenCounter(CONFIG["model"])
+
+async def fit_context(latest: str, turns: list = None, pdf_text: str = "") -> dict:
+    """Trim email and attachment text to the token budget; turns are earlier thread messages, oldest first"""
+    # Ranking attachment sentences is CPU-bound; keep it off the I/O threads
+    run = run_cpu if pdf_text else run_io
+    context = await run(build_context, token_counter, latest, turns or [], pdf_text)
+    if turns is None:
+        email_content = context["latest"]
+    else:
+        thread_text = "".join(f"\n---\n{turn}" for turn in context["turns"])
+        email_content = f"Email Thread Context:\n{thread_text}\n\nLatest Message:\n{context['latest']}"
+    return {"email_content": email_content, "pdf_text": context["pdf_text"], "tokens": context["tokens"]}
 
 def create_email_raw(to: str, subject: str, body: str) -> str:
     message = f"To: {to}\r\nSubject: {subject}\r\nContent-Type: text/plain; charset=utf-8\r\n\r\n{body}"
     raw = base64.urlsafe_b64encode(message.encode("utf-8")).decode("utf-8")
     return raw
 
-def generate_reply_with_agents(email_content: str, pdf_text: str = "") -> dict:
+def download_attachment(message_id: str, attachment_id: str) -> bytes:
+    """Fetch an attachment from Gmail and decode it to raw bytes"""
+    attachment = gmail.execute(gmail.users().messages().attachments().get(
+        userId="me", messageId=message_id, id=attachment_id
+    ))
+    return b64.urlsafe_b64decode(attachment.get("data", ""))
+
+# Local mirror of message metadata, kept current from Gmail history
+mailbox = MailboxStore(gmail)
+
+# Reply pairs mined from the Sent folder, used as style examples; ingestion is
+# background work, so it runs on the lower-priority Gmail budget
+sent_corpus = SentCorpus(gmail.with_quota(gmail_background_quota))
+background_tasks = []
+
+async def ingest_sent_mail():
+    while True:
+        try:
+            await run_io(sent_corpus.sync)
+        except Exception as e:
+            logger.warning("Sent mail ingestion failed: %s", e)
+        await asyncio.sleep(SENT_CORPUS_INTERVAL)
+
+# Raw attachments and their extracted text, keyed by content hash
+attachment_store = AttachmentStore()
+pdf_text_flights = SingleFlight()
+# Extractions beyond this wait here instead of overflowing the CPU pool's queue
+pdf_extract_slots = asyncio.Semaphore(PDF_MAX_CONCURRENT_DOCS)
+# Bump when extraction output changes so cached text is rebuilt
+PDF_TEXT_VARIANT = "text-v4" + (f"-ocr{PDF_OCR_DPI}" if PDF_OCR_ENABLED else "")
+
+async def fetch_attachment_bytes(message_id: str, attachment_id: str) -> tuple:
+    """Return (sha256, bytes) for an attachment, downloading it from Gmail at most once"""
+    return await run_io(attachment_store.get_bytes, message_id, attachment_id, download_attachment)
+
+async def pdf_text_for(pdf_bytes: bytes, sha: str = None) -> str:
+    """Extracted (and summarized) PDF text, parsed at most once per content hash"""
+    sha = sha or hashlib.sha256(pdf_bytes).hexdigest()
+
+    async def extract():
+        text = await run_io(attachment_store.get_text, sha, PDF_TEXT_VARIANT)
+        if text is None:
+            # Scanned pages are OCRed once per page image, even across different documents
+            async with pdf_extract_slots:
+                with metrics.stage("pdf_extract"):
+                    text = await extract_pdf_text(pdf_bytes, ocr_cache=attachment_store)
+            await run_io(attachment_store.put_text, sha, text, PDF_TEXT_VARIANT)
+        return text
+    return await pdf_text_flights.run(sha, extract)
+
+async def generate_reply_with_agents(email_content: str, pdf_text: str = "",
+                                     mode: str = DEFAULT_GENERATION_MODE, force_regenerate: bool = False) -> dict:
+    if mode not in GENERATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{mode}', expected one of {GENERATION_MODES}")
+
+    key = await run_io(reply_key, email_content, pdf_text, mode)
+    if not force_regenerate:
+        cached = await run_io(reply_cache.get, key)
+        if cached:
+            return {**cached, "cached": True}
+
+    response = await _generate_reply_with_agents(email_content, pdf_text, mode)
+    await run_io(reply_cache.set, key, response)
+    return {**response, "cached": False}
+
+reply_flights = SingleFlight()
+
+async def generate_reply(email_content: str, pdf_text: str = "", mode: str = DEFAULT_GENERATION_MODE,
+                         force_regenerate: bool = False) -> dict:
+    """Generate a reply; identical concurrent requests (e.g. a click during pre-generation) share one run"""
+    if force_regenerate:
+        return await generate_reply_with_agents(email_content, pdf_text, mode, True)
+    key = await run_io(reply_key, email_content, pdf_text, mode)
+    return await reply_flights.run(
+        key,
+        lambda: generate_reply_with_agents(email_content, pdf_text, mode)
+    )
+
+def build_writer_prompt(email_content: str, pdf_text: str = "", examples: str = "") -> str:
+    # Combine email content and PDF text for context
+    full_context = f"Email to reply to:\n{email_content}"
+    if pdf_text:
+        full_context += f"\n\nAdditional context from attached PDF:\n{pdf_text}"
+    return f"Please draft a content-appropriate reply to this email:\n{full_context}{examples}"
+
+def build_review_prompt(draft: str, examples: str = "") -> str:
+    return f"Rewrite this to match our style guide:\n{draft}{examples}"
+
+def writer_system_message(mode: str) -> str:
+    return ADAPTIVE_WRITER_SYSTEM_MESSAGE if mode == "adaptive" else WRITER_SYSTEM_MESSAGE
+
+def style_examples_for(email_content: str) -> str:
+    """Few-shot pairs: the user's own sent replies first, topped up from the curated examples"""
+    examples = sent_corpus.search(email_content, STYLE_EXAMPLES_K)
+    if len(examples) < STYLE_EXAMPLES_K:
+        examples += style_index.search(email_content, STYLE_EXAMPLES_K - len(examples))
+    return format_examples(examples, token_counter)
+
+async def _generate_reply_with_agents(email_content: str, pdf_text: str, mode: str) -> dict:
     try:
-        # Reset agents
-        writer_agent.reset()
-        review_agent.reset()
-        
-        # Combine email content and PDF text for context
-        full_context = f"Email to reply to:\n{email_content}"
-        if pdf_text:
-            full_context += f"\n\nAdditional context from attached PDF:\n{pdf_text}"
+        examples = await run_io(style_examples_for, email_content)
+        writer_prompt = build_writer_prompt(email_content, pdf_text, examples)
+
+        if mode == "fast":
+            final_reply = await llm.complete(FAST_SYSTEM_MESSAGE, writer_prompt, "fast")
+            return {
+                "draft_reply": final_reply,
+                "review_feedback": "Drafted and styled in a single pass",
+                "final_reply": final_reply,
+                "mode": mode
+            }
         
         # Generate content-focused draft
-        user_proxy.initiate_chat(
-            writer_agent,
-            message=f"Please draft a content-appropriate reply to this email:\n{full_context}"
-        )
-        draft = writer_agent.last_message()["content"]
+        draft = await llm.complete(writer_system_message(mode), writer_prompt, "writer")
+
+        # Adaptive mode skips the review pass when the draft already conforms
+        style_issues = check_style(draft, USER_STYLE) if mode == "adaptive" else []
+        if mode == "adaptive" and not style_issues:
+            return {
+                "draft_reply": draft,
+                "review_feedback": "Draft already matched style guidelines",
+                "final_reply": draft,
+                "mode": mode
+            }
         
         # Get styled version
-        user_proxy.initiate_chat(
-            review_agent,
-            message=f"Rewrite this to match our style guide:\n{draft}"
-        )
-        final_reply = review_agent.last_message()["content"]
+        final_reply = await llm.complete(REVIEW_SYSTEM_MESSAGE, build_review_prompt(draft, examples), "review")
         
         return {
             "draft_reply": draft,
-            "review_feedback": "Automatically styled to match guidelines",
-            "final_reply": final_reply
+            "review_feedback": (f"Styled to fix: {', '.join(style_issues)}" if style_issues
+                                else "Automatically styled to match guidelines"),
+            "final_reply": final_reply,
+            "mode": mode
         }
         
     except Exception as e:
@@ -178,164 +314,464 @@ class EmailResponse(BaseModel):
     draft_reply: str
     review_feedback: str
     final_reply: str
+    mode: str
+    cached: bool
 
 # API Endpoints
 @app.get("/emails")
-async def fetch_latest_emails():
+async def fetch_latest_emails(page_size: int = 5, page_token: Optional[str] = None):
     try:
-        service = build("gmail", "v1", credentials=gmail_creds)
-        results = service.users().messages().list(userId="me", labelIds=["INBOX"], maxResults=5, q="is:unread").execute()
-        messages = results.get("messages", [])
-
-        emails = []
-        for msg in messages:
-            msg_data = service.users().messages().get(userId="me", id=msg["id"]).execute()
-            payload = msg_data.get("payload", {})
-            headers = payload.get("headers", [])
-            subject = next((h["value"] for h in headers if h["name"] == "Subject"), "(No Subject)")
-            sender = next((h["value"] for h in headers if h["name"] == "From"), "Unknown")
-            snippet = msg_data.get("snippet", "")
-            thread_id = msg_data.get("threadId")
-            
-            # Check for attachments
-            attachments = []
-            if "parts" in payload:
-                for part in payload.get("parts", []):
-                    if part.get("filename", "").endswith(".pdf"):
-                        attach_id = part.get("body", {}).get("attachmentId")
-                        if attach_id:
-                            attachments.append({
-                                "id": attach_id,
-                                "filename": part.get("filename")
-                            })
-            
-            emails.append({
-                "id": msg["id"], 
-                "subject": subject, 
-                "from": sender, 
-                "snippet": snippet, 
-                "threadId": thread_id,
-                "attachments": attachments
-            })
-
-        return {"emails": emails}
+        # Apply Gmail history deltas, then serve the listing from the local mailbox
+        await run_io(mailbox.sync)
+        return await run_io(mailbox.list_unread, page_size, page_token)
 
     except Exception as e:
         return {"error": str(e)}
 
+# Attachment bytes never change for a given (message, attachment) pair
+ATTACHMENT_CACHE_CONTROL = "private, max-age=86400"
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    if not if_none_match:
+        return False
+    tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+    return "*" in tags or etag in tags
+
 @app.get("/email/attachment/{message_id}/{attachment_id}")
-async def get_attachment(message_id: str, attachment_id: str):
+async def get_attachment(message_id: str, attachment_id: str, request: Request, format: str = "binary"):
+    """Raw PDF with a content-hash ETag and Range support; format=json returns the old base64 payload"""
     try:
-        service = build("gmail", "v1", credentials=gmail_creds)
-        attachment = service.users().messages().attachments().get(
-            userId="me", messageId=message_id, id=attachment_id
-        ).execute()
-        
-        pdf_data = b64.urlsafe_b64decode(attachment.get("data", ""))
-        pdf_base64 = b64.b64encode(pdf_data).decode("utf-8")
-        
-        return {"pdf": pdf_base64}
+        if format == "json":
+            _, pdf_data = await fetch_attachment_bytes(message_id, attachment_id)
+            pdf_base64 = b64.b64encode(pdf_data).decode("utf-8")
+            return {"pdf": pdf_base64}
+
+        sha, path = await run_io(attachment_store.get_file, message_id, attachment_id, download_attachment)
+        headers = {"ETag": f'"{sha}"', "Cache-Control": ATTACHMENT_CACHE_CONTROL}
+        if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+
+        msg = await run_io(mailbox.get_message, message_id)
+        filename = next((a["filename"] for a in (msg or {}).get("attachments", []) if a["id"] == attachment_id),
+                        "Attachment.pdf")
+        # FileResponse streams from disk in chunks and answers Range / If-Range itself
+        return FileResponse(path, media_type="application/pdf", headers=headers,
+                            filename=filename, content_disposition_type="inline")
     except Exception as e:
-        return {"error": str(e)}
+        return JSONResponse({"error": str(e)}, status_code=502)
 
 @app.post("/generate")
 async def generate_email_response(
     email_text: str = Form(...),
-    pdf: UploadFile = File(None)
+    pdf: UploadFile = File(None),
+    mode: str = Form(DEFAULT_GENERATION_MODE),
+    force_regenerate: bool = Form(False)
 ):
     pdf_text = ""
     if pdf:
         pdf_bytes = await pdf.read()
-        pdf_text = extract_text_from_pdf(pdf_bytes)
+        pdf_text = await pdf_text_for(pdf_bytes)
 
     try:
-        response = generate_reply_with_agents(email_text, pdf_text)
-        return response
+        context = await fit_context(email_text, None, pdf_text)
+        response = await generate_reply(context["email_content"], context["pdf_text"], mode, force_regenerate)
+        return {**response, "context_tokens": context["tokens"]}
     except Exception as e:
         return {"error": str(e)}
 
+async def load_message_and_thread(id: str) -> tuple:
+    """Read a message and its thread from the local mailbox, touching Gmail only for missing data"""
+    await run_io(mailbox.sync)
+    msg = await run_io(mailbox.get_message, id)
+    if msg is None:
+        msg = await run_io(mailbox.fetch_message, id)
+        if msg is None:
+            raise HTTPException(status_code=404, detail=f"Message {id} not found")
+        thread = await run_io(mailbox.fetch_thread, msg["threadId"])
+    else:
+        thread = await run_io(mailbox.get_thread, msg["threadId"])
+    return msg, thread
+
+async def load_thread_pdfs(latest_id: str, thread_messages: list) -> list:
+    """
+    Every PDF in the thread, the latest message's first and then newest to oldest.
+    Downloads run concurrently, copies re-attached in replies are dropped by content
+    hash, and the remaining documents are extracted in parallel. An attachment that
+    fails to download or extract is skipped rather than failing the whole context.
+    """
+    ordered = sorted(reversed(thread_messages), key=lambda m: m["id"] != latest_id)
+    refs = [(m["id"], a) for m in ordered for a in m["attachments"]]
+    fetched = await asyncio.gather(*(fetch_attachment_bytes(mid, a["id"]) for mid, a in refs),
+                                   return_exceptions=True)
+
+    pdfs = {}
+    for (mid, attachment), result in zip(refs, fetched):
+        if isinstance(result, Exception):
+            logger.warning("Skipping attachment %s of %s: %s", attachment["id"], mid, result)
+            continue
+        sha, data = result
+        if sha not in pdfs:
+            pdfs[sha] = {"messageId": mid, "id": attachment["id"], "filename": attachment["filename"],
+                         "size": len(data), "sha256": sha, "data": data}
+
+    texts = await asyncio.gather(*(pdf_text_for(pdf["data"], sha) for sha, pdf in pdfs.items()),
+                                 return_exceptions=True)
+    extracted = []
+    for pdf, text in zip(pdfs.values(), texts):
+        if isinstance(text, Exception):
+            logger.warning("Skipping attachment %s of %s: %s", pdf["id"], pdf["messageId"], text)
+            continue
+        pdf["text"] = text
+        extracted.append(pdf)
+    return extracted
+
+async def load_gmail_context(id: str) -> dict:
+    """Load a message, its thread and every PDF attached in the thread for reply generation"""
+    msg, thread_messages = await load_message_and_thread(id)
+
+    thread_context = [
+        {
+            "snippet": m["snippet"],
+            "id": m["id"],
+            "attachments": [{"id": a["id"], "filename": a["filename"]} for a in m["attachments"]]
+        }
+        for m in thread_messages
+    ]
+
+    pdfs = await load_thread_pdfs(id, thread_messages)
+    # The latest message's first PDF is the one returned to the client
+    primary = pdfs[0] if pdfs and pdfs[0]["messageId"] == id else None
+    # Passages from every document compete for the attachment budget, ranked against the latest message
+    pdf_text = "\n\n".join(pdf["text"] for pdf in pdfs if pdf["text"])
+
+    # Earlier turns only: the latest message has its own section of the budget
+    turns = [m["snippet"] for m in thread_messages if m["id"] != id]
+    context = await fit_context(msg["snippet"], turns, pdf_text)
+
+    return {
+        "email_content": context["email_content"],
+        "pdf_text": context["pdf_text"],
+        "context_tokens": context["tokens"],
+        "thread": thread_context,
+        "pdf_data": primary["data"] if primary else None,
+        "pdf_sha": primary["sha256"] if primary else None,
+        "pdf_id": primary["id"] if primary else None,
+        "pdf_filename": primary["filename"] if primary else "Attachment.pdf",
+        "attachments": [
+            {key: pdf[key] for key in ("messageId", "id", "filename", "size", "sha256")} for pdf in pdfs
+        ]
+    }
+
+async def pregen_candidates() -> list:
+    await run_io(mailbox.sync)
+    return await run_io(mailbox.unread_thread_heads, PREGEN_MAX_MESSAGES)
+
+async def pregen_draft(message_id: str):
+    context = await load_gmail_context(message_id)
+    await generate_reply(context["email_content"], context["pdf_text"], DEFAULT_GENERATION_MODE)
+
+# Background drafts for new unread mail, stored in reply_cache so a click is a cache hit
+pregen_worker = PregenWorker(pregen_candidates, pregen_draft)
+
 @app.get("/generate_with_pdf")
-async def generate_response_using_gmail_data(id: str):
+async def generate_response_using_gmail_data(id: str, mode: str = DEFAULT_GENERATION_MODE,
+                                             force_regenerate: bool = False, attachments: str = "inline"):
+    """attachments=refs returns the attachment's id, size and hash instead of inlining it as base64"""
     try:
-        service = build("gmail", "v1", credentials=gmail_creds)
-        msg = service.users().messages().get(userId="me", id=id).execute()
-
-        latest_snippet = msg.get("snippet", "")
-        thread_id = msg.get("threadId")
-
-        thread = service.users().threads().get(userId="me", id=thread_id).execute()
-        thread_messages = thread.get("messages", [])
-        thread_context = []
+        context = await load_gmail_context(id)
+        pdf_data = context["pdf_data"]
         
-        for m in thread_messages:
-            m_data = {
-                "snippet": m.get("snippet", ""),
-                "id": m.get("id", ""),
-                "attachments": []
-            }
-            
-            # Extract any PDF attachments
-            payload = m.get("payload", {})
-            if "parts" in payload:
-                for part in payload.get("parts", []):
-                    if part.get("filename", "").endswith(".pdf"):
-                        attach_id = part.get("body", {}).get("attachmentId")
-                        if attach_id:
-                            m_data["attachments"].append({
-                                "id": attach_id,
-                                "filename": part.get("filename", "Unknown.pdf")
-                            })
-            
-            thread_context.append(m_data)
-
-        # Create a text-only version of the thread context
-        thread_text = ""
-        for m in thread_context:
-            thread_text += f"\n---\n{m['snippet']}"
-
-        # Get the PDF from the current message if it exists
-        pdf_data = None
-        pdf_filename = "Attachment.pdf"
-        for part in msg.get("payload", {}).get("parts", []):
-            if part.get("filename", "").endswith(".pdf"):
-                attach_id = part.get("body", {}).get("attachmentId")
-                pdf_filename = part.get("filename", "Attachment.pdf")
-                if attach_id:
-                    attachment = service.users().messages().attachments().get(
-                        userId="me", messageId=id, id=attach_id
-                    ).execute()
-                    pdf_data = b64.urlsafe_b64decode(attachment.get("data", ""))
-                    break
-
-        pdf_text = extract_text_from_pdf(pdf_data) if pdf_data else ""
-        
-        # Generate reply using AutoGen agents
-        response = generate_reply_with_agents(
-            email_content=f"Email Thread Context:\n{thread_text}\n\nLatest Message:\n{latest_snippet}",
-            pdf_text=pdf_text
+        # Generate reply with the writer and review passes
+        response = await generate_reply(
+            email_content=context["email_content"],
+            pdf_text=context["pdf_text"],
+            mode=mode,
+            force_regenerate=force_regenerate
         )
         
-        return {
+        payload = {
             "response": response["final_reply"],
             "draft": response["draft_reply"],
-            "thread": thread_context,
-            "pdf": b64.b64encode(pdf_data).decode("utf-8") if pdf_data else "",
-            "pdfFilename": pdf_filename
+            "thread": context["thread"],
+            "pdfFilename": context["pdf_filename"],
+            "mode": response["mode"],
+            "cached": response["cached"],
+            "contextTokens": context["context_tokens"]
         }
-
+        if attachments == "refs":
+            # The client fetches the bytes itself from the cacheable attachment endpoint
+            payload["attachment"] = {
+                "messageId": id,
+                "id": context["pdf_id"],
+                "filename": context["pdf_filename"],
+                "size": len(pdf_data),
+                "sha256": context["pdf_sha"],
+                "url": f"/email/attachment/{id}/{context['pdf_id']}"
+            } if pdf_data else None
+            payload["attachments"] = [
+                {**pdf, "url": f"/email/attachment/{pdf['messageId']}/{pdf['id']}"} for pdf in context["attachments"]
+            ]
+        else:
+            payload["pdf"] = b64.b64encode(pdf_data).decode("utf-8") if pdf_data else ""
+        return json_response(payload, "/generate_with_pdf")
+
+    except HTTPException:
+        # Unknown message or mode keeps its 404/400 status
+        raise
     except Exception as e:
         return {"error": str(e)}
 
+async def stream_reply_events(email_content: str, pdf_text: str = "", mode: str = DEFAULT_GENERATION_MODE,
+                              force_regenerate: bool = False):
+    """SSE stream of the reply pipeline: stage markers, draft tokens, final tokens, then done"""
+    if mode not in GENERATION_MODES:
+        raise ValueError(f"Unknown mode '{mode}', expected one of {GENERATION_MODES}")
+
+    key = await run_io(reply_key, email_content, pdf_text, mode)
+    if not force_regenerate:
+        cached = await run_io(reply_cache.get, key)
+        if cached:
+            yield sse_event("done", {**cached, "cached": True})
+            return
+        # Join a generation already running for the same input (e.g. pre-generation) instead of starting another
+        flight = reply_flights.pending(key)
+        if flight is not None:
+            yield sse_event("stage", {"stage": "waiting", "mode": mode})
+            yield sse_event("done", await asyncio.shield(flight))
+            return
+
+    async for event in _stream_reply_events(email_content, pdf_text, mode, key):
+        yield event
+
+async def finish_stream(key: str, response: dict) -> str:
+    """Cache a completed streamed reply and format the closing done event"""
+    await run_io(reply_cache.set, key, response)
+    return sse_event("done", {**response, "cached": False})
+
+async def _stream_reply_events(email_content: str, pdf_text: str, mode: str, key: str):
+    examples = await run_io(style_examples_for, email_content)
+    writer_prompt = build_writer_prompt(email_content, pdf_text, examples)
+    final_parts = []
+
+    if mode == "fast":
+        yield sse_event("stage", {"stage": "final", "mode": mode})
+        async for event in stream_pass(llm, FAST_SYSTEM_MESSAGE, writer_prompt, "final", final_parts, "fast"):
+            yield event
+        final_reply = "".join(final_parts)
+        yield await finish_stream(key, {
+            "draft_reply": final_reply,
+            "review_feedback": "Drafted and styled in a single pass",
+            "final_reply": final_reply,
+            "mode": mode
+        })
+        return
+
+    yield sse_event("stage", {"stage": "draft", "mode": mode})
+    draft_parts = []
+    async for event in stream_pass(llm, writer_system_message(mode), writer_prompt, "draft", draft_parts, "writer"):
+        yield event
+    draft = "".join(draft_parts)
+
+    style_issues = check_style(draft, USER_STYLE) if mode == "adaptive" else []
+    if mode == "adaptive" and not style_issues:
+        yield await finish_stream(key, {
+            "draft_reply": draft,
+            "review_feedback": "Draft already matched style guidelines",
+            "final_reply": draft,
+            "mode": mode
+        })
+        return
+
+    yield sse_event("stage", {"stage": "review", "mode": mode})
+    async for event in stream_pass(llm, REVIEW_SYSTEM_MESSAGE, build_review_prompt(draft, examples),
+                                   "final", final_parts, "review"):
+        yield event
+    yield await finish_stream(key, {
+        "draft_reply": draft,
+        "review_feedback": (f"Styled to fix: {', '.join(style_issues)}" if style_issues
+                            else "Automatically styled to match guidelines"),
+        "final_reply": "".join(final_parts),
+        "mode": mode
+    })
+
+@app.post("/generate/stream")
+async def stream_email_response(
+    email_text: str = Form(...),
+    pdf: UploadFile = File(None),
+    mode: str = Form(DEFAULT_GENERATION_MODE),
+    force_regenerate: bool = Form(False)
+):
+    pdf_bytes = await pdf.read() if pdf else None
+
+    async def events():
+        try:
+            pdf_text = ""
+            if pdf_bytes:
+                yield sse_event("stage", {"stage": "context"})
+                pdf_text = await pdf_text_for(pdf_bytes)
+            context = await fit_context(email_text, None, pdf_text)
+            yield sse_event("context", {"contextTokens": context["tokens"]})
+            async for event in stream_reply_events(context["email_content"], context["pdf_text"], mode,
+                                                   force_regenerate):
+                yield event
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+@app.get("/generate_with_pdf/stream")
+async def stream_response_using_gmail_data(id: str, mode: str = DEFAULT_GENERATION_MODE,
+                                           force_regenerate: bool = False):
+    async def events():
+        try:
+            yield sse_event("stage", {"stage": "context"})
+            context = await load_gmail_context(id)
+            yield sse_event("context", {
+                "thread": context["thread"],
+                "pdfFilename": context["pdf_filename"] if context["pdf_data"] else "",
+                "contextTokens": context["context_tokens"]
+            })
+            async for event in stream_reply_events(context["email_content"], context["pdf_text"], mode,
+                                                   force_regenerate):
+                yield event
+        except Exception as e:
+            yield sse_event("error", {"error": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
+class BatchRequest(BaseModel):
+    ids: List[str] = []
+    texts: List[str] = []
+    mode: str = DEFAULT_GENERATION_MODE
+
+async def generate_batch_item(item: dict) -> dict:
+    if "id" in item:
+        context = await load_gmail_context(item["id"])
+        response = await generate_reply(context["email_content"], context["pdf_text"], item["mode"])
+    else:
+        # Same budgeting as /generate, so identical text shares its cache entry
+        context = await fit_context(item["text"], None, "")
+        response = await generate_reply(context["email_content"], context["pdf_text"], item["mode"])
+    return {
+        "response": response["final_reply"],
+        "draft": response["draft_reply"],
+        "mode": response["mode"],
+        "cached": response["cached"]
+    }
+
+# Bulk generation jobs; throughput is paced by openai_limiter and gmail_quota
+batch_jobs = BatchJobManager(generate_batch_item)
+
+@app.post("/generate/batch")
+async def submit_batch(request: BatchRequest):
+    if request.mode not in GENERATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unknown mode '{request.mode}', expected one of {GENERATION_MODES}")
+    items = ([{"id": id, "mode": request.mode} for id in request.ids] +
+             [{"text": text, "mode": request.mode} for text in request.texts])
+    if not items or len(items) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=400, detail=f"Expected between 1 and {BATCH_MAX_ITEMS} items")
+    job = batch_jobs.submit(items)
+    return {"job_id": job.id, "total": len(items)}
+
+@app.get("/generate/batch/{job_id}")
+async def get_batch(job_id: str, since: int = 0):
+    """Poll a job; pass the previous response's `next` as `since` to receive only new results"""
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Batch job {job_id} not found")
+    return job.snapshot(since)
+
+@app.get("/generate/batch/{job_id}/stream")
+async def stream_batch(job_id: str):
+    job = batch_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Batch job {job_id} not found")
+
+    async def events():
+        async for item in job.updates():
+            yield sse_event("item", item)
+        summary = job.snapshot()
+        summary.pop("results")
+        yield sse_event("done", summary)
+    return StreamingResponse(events(), media_type="text/event-stream", headers=SSE_HEADERS)
+
 @app.post("/send")
 async def send_email(to: str = Form(...), subject: str = Form(...), body: str = Form(...)):
     try:
-        service = build("gmail", "v1", credentials=gmail_creds)
         raw = create_email_raw(to, subject, body)
         message = {"raw": raw}
-        send_result = service.users().messages().send(userId="me", body=message).execute()
+        send_result = await run_io(gmail.execute, gmail.users().messages().send(userId="me", body=message))
         return {"status": "sent", "id": send_result["id"]}
     except Exception as e:
         return {"status": "error", "message": str(e)}
 
+@app.get("/stats")
+async def get_stats():
+    return {"executors": executors.stats(), "gmail": gmail.stats(), "reply_cache": reply_cache.stats(),
+            "attachments": attachment_store.stats(), "llm": llm.stats(),
+            "mailbox": mailbox.stats(), "pregen": pregen_worker.stats(), "batch": batch_jobs.stats(),
+            "style_examples": style_index.stats(), "sent_corpus": sent_corpus.stats(),
+            "rate_limits": {"openai": openai_limiter.stats(), "gmail": gmail_quota.stats(),
+                            "gmail_background": gmail_background_quota.stats()},
+            "responses": response_metrics.stats()}
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus exposition of request, stage, token and PDF metrics"""
+    return metrics.metrics_response()
+
+# Heavy libraries kept out of the import path; loaded in the background once the server is up
+PRELOAD_MODULES = ("fitz", "summarizer", "sklearn.feature_extraction.text")
+readiness = {"preloaded": False, "preload_error": None, "mailbox_synced": False, "ready_after": None}
+STARTED_AT = time.time()
+
+def preload():
+    for name in PRELOAD_MODULES:
+        importlib.import_module(name)
+    gmail.service
+    style_index.load()
+    token_counter.encoding
+
+@app.get("/ready")
+async def ready():
+    """Readiness probe: 503 until heavy modules are loaded"""
+    return JSONResponse(readiness, status_code=200 if readiness["preloaded"] else 503)
+
+@app.on_event("startup")
+async def start_mailbox_sync():
+    async def warm_modules():
+        try:
+            await run_io(preload)
+        except Exception as e:
+            # Stay unready so the probe keeps traffic away from a worker that cannot serve it
+            logger.exception("Preloading failed")
+            readiness["preload_error"] = str(e)
+            return
+        readiness["preloaded"] = True
+        readiness["ready_after"] = round(time.time() - STARTED_AT, 3)
+
+    # Warm the local mailbox in the background so the first /emails call does not pay for a full sync
+    async def warm():
+        try:
+            await run_io(mailbox.sync)
+            readiness["mailbox_synced"] = True
+        except Exception as e:
+            logger.warning("Initial mailbox sync failed: %s", e)
+    asyncio.create_task(warm_modules())
+    asyncio.create_task(warm())
+    if PREGEN_ENABLED:
+        pregen_worker.start()
+    if SENT_CORPUS_ENABLED:
+        background_tasks.append(asyncio.create_task(ingest_sent_mail()))
+
+@app.on_event("shutdown")
+async def shutdown_executors():
+    await pregen_worker.stop()
+    for task in background_tasks:
+        task.cancel()
+    await batch_jobs.shutdown()
+    executors.shutdown()
+    await llm.aclose()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
@@ -0,0 +1,133 @@
+import time
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from prometheus_client import Counter, Gauge, Histogram, CONTENT_TYPE_LATEST, generate_latest
+from starlette.datastructures import MutableHeaders
+from starlette.responses import Response
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_SECONDS = Histogram(
+    "email_assistant_request_seconds", "HTTP request latency", ["route", "method", "status"],
+    buckets=LATENCY_BUCKETS
+)
+REQUESTS_IN_FLIGHT = Gauge("email_assistant_requests_in_flight", "HTTP requests being served")
+STAGE_SECONDS = Histogram(
+    "email_assistant_stage_seconds", "Time spent per stage (Gmail calls, PDF extraction, LLM passes)", ["stage"],
+    buckets=LATENCY_BUCKETS
+)
+LLM_TOKENS = Counter("email_assistant_llm_tokens", "LLM tokens by agent pass", ["agent", "kind"])
+PDF_PAGES = Counter("email_assistant_pdf_pages", "PDF pages extracted", ["method"])
+PDF_BYTES = Counter("email_assistant_pdf_bytes", "Bytes of PDF extracted")
+RESPONSE_BYTES = Histogram(
+    "email_assistant_response_bytes", "Response body size before and after compression", ["route", "encoding"],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+)
+
+
+class RequestMetrics:
+    """Stage timings and counts for one request, reported in its Server-Timing header"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stages = {}
+        self.counts = {}
+
+    def add_stage(self, name: str, seconds: float):
+        with self._lock:
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+    def add_count(self, name: str, value: int):
+        with self._lock:
+            self.counts[name] = self.counts.get(name, 0) + value
+
+    def server_timing(self, total: float) -> str:
+        with self._lock:
+            entries = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in self.stages.items()]
+            if self.counts:
+                counts = " ".join(f"{name}={value}" for name, value in self.counts.items())
+                entries.append(f'counts;desc="{counts}"')
+        entries.append(f"total;dur={total * 1000:.1f}")
+        return ", ".join(entries)
+
+
+# Set by MetricsMiddleware for the duration of each request; thread-pool calls inherit it via run_io
+_current = contextvars.ContextVar("request_metrics", default=None)
+
+
+@contextmanager
+def stage(name: str):
+    """Time a block into the stage histogram and the current request's Server-Timing"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - start
+        STAGE_SECONDS.labels(name).observe(elapsed)
+        request = _current.get()
+        if request is not None:
+            request.add_stage(name, elapsed)
+
+
+def count(name: str, value: int):
+    request = _current.get()
+    if request is not None:
+        request.add_count(name, value)
+
+
+def record_tokens(agent: str, prompt_tokens: int, completion_tokens: int):
+    LLM_TOKENS.labels(agent, "prompt").inc(prompt_tokens)
+    LLM_TOKENS.labels(agent, "completion").inc(completion_tokens)
+    count("prompt_tokens", prompt_tokens)
+    count("completion_tokens", completion_tokens)
+
+
+def record_pdf(pages: int, size: int, ocr_pages: int = 0):
+    PDF_PAGES.labels("text").inc(pages - ocr_pages)
+    PDF_PAGES.labels("ocr").inc(ocr_pages)
+    PDF_BYTES.inc(size)
+    count("pdf_pages", pages)
+    count("pdf_bytes", size)
+
+
+def metrics_response() -> Response:
+    return Response(generate_latest(), media_type=CONTENT_TYPE_LATEST)
+
+
+class MetricsMiddleware:
+    """
+    Request latency and in-flight gauge per route, plus a Server-Timing header with the
+    stages that ran before the response started (all of them, except for streams)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request = RequestMetrics()
+        token = _current.set(request)
+        start = time.perf_counter()
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                headers = MutableHeaders(raw=message["headers"])
+                headers.append("Server-Timing", request.server_timing(time.perf_counter() - start))
+            await send(message)
+
+        REQUESTS_IN_FLIGHT.inc()
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            REQUESTS_IN_FLIGHT.dec()
+            _current.reset(token)
+            route = getattr(scope.get("route"), "path", "unmatched")
+            REQUEST_SECONDS.labels(route, scope["method"], str(status)).observe(time.perf_counter() - start)
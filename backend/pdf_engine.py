@@ -0,0 +1,167 @@
+import os
+import asyncio
+import logging
+import tempfile
+import importlib.util
+from collections import deque
+from contextlib import contextmanager
+
+import metrics
+from executors import run_cpu, run_io, CPU_WORKERS, CPU_MAX_QUEUE
+from pdf_text import count_pages, extract_page_range, scan_pages, ocr_page, summarize_text, SUMMARIZE_ABOVE_WORDS
+
+logger = logging.getLogger(__name__)
+
+# Pages handed to one worker call
+PDF_SHARD_PAGES = int(os.getenv("PDF_SHARD_PAGES", "16"))
+# Stop extracting once this many words are collected (0 = read the whole document).
+# Sized for ~1,000-page documents: the map-reduce summarizer handles them in linear time
+PDF_WORD_BUDGET = int(os.getenv("PDF_WORD_BUDGET", "500000"))
+# Shards submitted ahead of the consumer; bounds wasted work after an early stop
+PDF_MAX_INFLIGHT_SHARDS = int(os.getenv("PDF_MAX_INFLIGHT_SHARDS", str(CPU_WORKERS * 2)))
+# Documents extracted at once across the worker; their shards fill at most half the CPU queue
+PDF_MAX_CONCURRENT_DOCS = int(os.getenv(
+    "PDF_MAX_CONCURRENT_DOCS", str(max(1, CPU_MAX_QUEUE // (2 * PDF_MAX_INFLIGHT_SHARDS)))
+))
+# Documents above this size are shared with workers through a file instead of pickled per shard
+PDF_SPILL_BYTES = int(os.getenv("PDF_SPILL_BYTES", str(1024 * 1024)))
+PDF_SPILL_DIR = os.getenv("PDF_SPILL_DIR", "/dev/shm" if os.path.isdir("/dev/shm") else None)
+
+# OCR of scanned pages: "auto" turns it on when pytesseract and Pillow are installed
+PDF_OCR = os.getenv("PDF_OCR", "auto").lower()
+PDF_OCR_ENABLED = (
+    importlib.util.find_spec("pytesseract") is not None and importlib.util.find_spec("PIL") is not None
+) if PDF_OCR == "auto" else PDF_OCR in ("1", "true", "yes")
+PDF_OCR_DPI = int(os.getenv("PDF_OCR_DPI", "300"))
+PDF_OCR_LANG = os.getenv("PDF_OCR_LANG", "eng")
+# Image pages whose text layer has fewer words than this are OCRed
+PDF_OCR_MIN_WORDS = int(os.getenv("PDF_OCR_MIN_WORDS", "25"))
+
+
+@contextmanager
+def shared_source(pdf_bytes: bytes):
+    """Yield something every worker can open: the bytes themselves, or a temp file for large documents"""
+    if not isinstance(pdf_bytes, (bytes, bytearray)) or len(pdf_bytes) < PDF_SPILL_BYTES:
+        yield pdf_bytes
+        return
+    fd, path = tempfile.mkstemp(suffix=".pdf", dir=PDF_SPILL_DIR)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(pdf_bytes)
+        yield path
+    finally:
+        os.remove(path)
+
+
+async def iter_pdf_pages(pdf_bytes: bytes, word_budget: int = PDF_WORD_BUDGET,
+                         shard_pages: int = PDF_SHARD_PAGES, info: dict = None):
+    """
+    Yield (page_number, text) in page order while page ranges are extracted in
+    parallel on the process pool. Stops, and cancels outstanding shards, once
+    word_budget words have been yielded. info, if given, receives total_pages.
+    """
+    with shared_source(pdf_bytes) as source:
+        total_pages = await run_cpu(count_pages, source)
+        if info is not None:
+            info["total_pages"] = total_pages
+        ranges = deque((start, min(start + shard_pages, total_pages))
+                       for start in range(0, total_pages, shard_pages))
+        pending = deque()
+        words = 0
+        try:
+            while ranges or pending:
+                while ranges and len(pending) < PDF_MAX_INFLIGHT_SHARDS:
+                    start, end = ranges.popleft()
+                    pending.append((start, asyncio.ensure_future(run_cpu(extract_page_range, source, start, end))))
+                start, shard = pending.popleft()
+                for offset, page_text in enumerate(await shard):
+                    yield start + offset, page_text
+                    words += len(page_text.split())
+                    if word_budget and words >= word_budget:
+                        return
+        finally:
+            for _, shard in pending:
+                shard.cancel()
+            await asyncio.gather(*(shard for _, shard in pending), return_exceptions=True)
+
+
+async def ocr_sparse_pages(source, texts: list, cache=None, dpi: int = PDF_OCR_DPI,
+                           lang: str = PDF_OCR_LANG) -> int:
+    """
+    Replace the text of scanned pages (images with little or no text layer) in texts with
+    OCR output. Only those pages are rendered, concurrently on the process pool, and
+    results are cached per page fingerprint in cache (get_text/put_text) when given.
+    Returns the number of pages whose text was replaced.
+    """
+    sparse = [i for i, text in enumerate(texts) if len(text.split()) < PDF_OCR_MIN_WORDS]
+    if not sparse:
+        return 0
+    fingerprints = await run_cpu(scan_pages, source, sparse)
+    variant = f"ocr-{dpi}-{lang}"
+    limit = asyncio.Semaphore(PDF_MAX_INFLIGHT_SHARDS)
+
+    async def ocr(page: int, fingerprint: str) -> str:
+        # Cache lookups count against the limit too: hundreds at once would overflow the I/O queue
+        async with limit:
+            text = await run_io(cache.get_text, fingerprint, variant) if cache is not None else None
+            if text is None:
+                text = await run_cpu(ocr_page, source, page, dpi, lang)
+                if cache is not None:
+                    await run_io(cache.put_text, fingerprint, text, variant)
+        return text
+
+    # Identical page images (letterheads, repeated scans) are OCRed once
+    unique = {}
+    for page, fingerprint in fingerprints.items():
+        unique.setdefault(fingerprint, page)
+    results = await asyncio.gather(*(ocr(page, fp) for fp, page in unique.items()), return_exceptions=True)
+    by_fingerprint = dict(zip(unique, results))
+    failures = [result for result in results if isinstance(result, Exception)]
+    if failures:
+        logger.warning("OCR failed on %d of %d pages: %s", len(failures), len(results), failures[0])
+
+    replaced = 0
+    for page, fingerprint in fingerprints.items():
+        text = by_fingerprint[fingerprint]
+        if not isinstance(text, Exception) and len(text.split()) > len(texts[page].split()):
+            texts[page] = text
+            replaced += 1
+    return replaced
+
+
+async def extract_pdf(pdf_bytes: bytes, word_budget: int = PDF_WORD_BUDGET,
+                      shard_pages: int = PDF_SHARD_PAGES, ocr: bool = PDF_OCR_ENABLED, ocr_cache=None) -> dict:
+    """
+    Extract a PDF into one string plus the character offset where each page starts,
+    so later stages can map passages back to pages or work page by page.
+    With ocr, scanned pages are OCRed after the text layer is read.
+    """
+    info = {}
+    parts = []
+    with shared_source(pdf_bytes) as source:
+        async for _, page_text in iter_pdf_pages(source, word_budget, shard_pages, info):
+            parts.append(page_text)
+        ocr_pages = await ocr_sparse_pages(source, parts, ocr_cache) if ocr and parts else 0
+    metrics.record_pdf(len(parts), len(pdf_bytes), ocr_pages)
+
+    page_offsets = []
+    position = 0
+    for page_text in parts:
+        page_offsets.append(position)
+        position += len(page_text)
+    return {
+        "text": "".join(parts),
+        "page_offsets": page_offsets,
+        "pages": len(parts),
+        "total_pages": info.get("total_pages", 0),
+        "truncated": len(parts) < info.get("total_pages", 0),
+        "ocr_pages": ocr_pages
+    }
+
+
+async def extract_pdf_text(pdf_bytes: bytes, word_budget: int = PDF_WORD_BUDGET, ocr_cache=None) -> str:
+    """Extract a PDF's text within budget, then summarize it if long"""
+    text = (await extract_pdf(pdf_bytes, word_budget, ocr_cache=ocr_cache))["text"].strip()
+    if len(text.split()) > SUMMARIZE_ABOVE_WORDS:
+        return await run_cpu(summarize_text, text)
+    return text
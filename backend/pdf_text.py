@@ -0,0 +1,64 @@
+import os
+import hashlib
+
+# No app state in this module: process-pool workers import it directly.
+# PyMuPDF and the summarizer (scikit-learn) are imported on first use so
+# importing this module stays cheap for the web process.
+
+# Documents longer than this are reduced to an extractive summary
+SUMMARIZE_ABOVE_WORDS = 1000
+
+
+def summarize_text(text: str, max_sentences: int = 10) -> str:
+    """
+    Extractive summarization with hashed TF-IDF sentence scoring (see summarizer.py)
+    """
+    from summarizer import summarize
+    return summarize(text, max_sentences)
+
+def open_pdf(source):
+    """Open a PDF from raw bytes or from a file path"""
+    import fitz  # PyMuPDF
+    if isinstance(source, (bytes, bytearray)):
+        return fitz.open(stream=source, filetype="pdf")
+    return fitz.open(source)
+
+def count_pages(source) -> int:
+    with open_pdf(source) as doc:
+        return len(doc)
+
+def extract_page_range(source, start: int, end: int) -> list:
+    """Text of pages [start, end); each process-pool worker opens its own handle on the document"""
+    with open_pdf(source) as doc:
+        return [doc[i].get_text() for i in range(start, min(end, len(doc)))]
+
+def scan_pages(source, pages: list) -> dict:
+    """
+    {page: fingerprint} for those of pages that contain images. The fingerprint hashes the
+    page's content stream and raw image data, so the same scan in another document matches.
+    """
+    fingerprints = {}
+    with open_pdf(source) as doc:
+        for i in pages:
+            page = doc[i]
+            images = page.get_images(full=True)
+            if not images:
+                continue
+            digest = hashlib.sha256(page.read_contents())
+            for image in images:
+                digest.update(doc.xref_stream_raw(image[0]) or b"")
+            fingerprints[i] = digest.hexdigest()
+    return fingerprints
+
+def ocr_page(source, page_number: int, dpi: int, lang: str = "eng") -> str:
+    """Render one page to a grayscale image at dpi and OCR it, without touching disk"""
+    import fitz
+    import pytesseract
+    from PIL import Image
+
+    # Pages are spread over the process pool; one Tesseract thread per page avoids oversubscription
+    os.environ.setdefault("OMP_THREAD_LIMIT", "1")
+    with open_pdf(source) as doc:
+        pixmap = doc[page_number].get_pixmap(dpi=dpi, colorspace=fitz.csGRAY, alpha=False)
+    image = Image.frombytes("L", (pixmap.width, pixmap.height), pixmap.samples)
+    return pytesseract.image_to_string(image, lang=lang)
@@ -0,0 +1,108 @@
+import os
+import time
+import asyncio
+import logging
+
+PREGEN_ENABLED = os.getenv("PREGEN_ENABLED", "1") == "1"
+# Seconds between scans of the unread inbox
+PREGEN_INTERVAL = float(os.getenv("PREGEN_INTERVAL", "30"))
+# Drafts generated at the same time; keeps background work from starving user requests
+PREGEN_CONCURRENCY = int(os.getenv("PREGEN_CONCURRENCY", "2"))
+# Only the newest unread messages are worth paying for
+PREGEN_MAX_MESSAGES = int(os.getenv("PREGEN_MAX_MESSAGES", "20"))
+
+logger = logging.getLogger(__name__)
+
+
+class PregenWorker:
+    """
+    Watches the unread inbox and precomputes replies, newest message first.
+
+    list_candidates() returns [(message_id, internal_date, thread_head)] where
+    thread_head is the id of the latest message in the thread; when it changes
+    the existing draft is stale and the message is queued again.
+    generate(message_id) produces the draft (the reply cache stores it).
+    """
+
+    def __init__(self, list_candidates, generate, concurrency: int = PREGEN_CONCURRENCY,
+                 interval: float = PREGEN_INTERVAL, max_messages: int = PREGEN_MAX_MESSAGES):
+        self.list_candidates = list_candidates
+        self.generate = generate
+        self.concurrency = concurrency
+        self.interval = interval
+        self.max_messages = max_messages
+        self.drafts = {}
+        self._queue = None
+        self._tasks = []
+        self.generated = 0
+        self.failed = 0
+        self.invalidated = 0
+
+    async def scan(self):
+        """Queue unread messages that have no draft for the current state of their thread"""
+        candidates = sorted(await self.list_candidates(), key=lambda c: -int(c[1] or 0))[:self.max_messages]
+        # Forget messages that were read or fell out of the window
+        current = {c[0] for c in candidates}
+        for message_id in [m for m, e in self.drafts.items() if m not in current and e["status"] != "running"]:
+            del self.drafts[message_id]
+        for message_id, internal_date, thread_head in candidates:
+            entry = self.drafts.get(message_id)
+            if entry and entry["thread_head"] == thread_head and entry["status"] in ("queued", "running", "ready"):
+                continue
+            if entry and entry["thread_head"] != thread_head:
+                self.invalidated += 1
+            self.drafts[message_id] = {"thread_head": thread_head, "status": "queued", "updated": time.time()}
+            # Newest first: PriorityQueue pops the smallest item
+            self._queue.put_nowait((-int(internal_date or 0), message_id, thread_head))
+
+    async def _consume(self):
+        while True:
+            _, message_id, thread_head = await self._queue.get()
+            entry = self.drafts.get(message_id)
+            # Skip entries superseded by a newer scan
+            if not entry or entry["thread_head"] != thread_head or entry["status"] != "queued":
+                self._queue.task_done()
+                continue
+            entry["status"] = "running"
+            try:
+                await self.generate(message_id)
+                entry["status"] = "ready"
+                self.generated += 1
+            except Exception as e:
+                entry["status"] = "failed"
+                entry["error"] = str(e)
+                self.failed += 1
+            entry["updated"] = time.time()
+            self._queue.task_done()
+
+    async def _watch(self):
+        while True:
+            try:
+                await self.scan()
+            except Exception as e:
+                logger.warning("Draft pre-generation scan failed: %s", e)
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._queue = asyncio.PriorityQueue()
+        self._tasks = [asyncio.create_task(self._watch())]
+        self._tasks += [asyncio.create_task(self._consume()) for _ in range(self.concurrency)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def stats(self) -> dict:
+        statuses = {}
+        for entry in self.drafts.values():
+            statuses[entry["status"]] = statuses.get(entry["status"], 0) + 1
+        return {
+            "running": bool(self._tasks),
+            "queued": self._queue.qsize() if self._queue else 0,
+            "drafts": statuses,
+            "generated": self.generated,
+            "failed": self.failed,
+            "invalidated": self.invalidated
+        }
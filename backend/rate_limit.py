@@ -0,0 +1,172 @@
+import os
+import time
+import asyncio
+import threading
+
+# OpenAI account limits for the configured model
+OPENAI_RPM = int(os.getenv("OPENAI_RPM", "500"))
+OPENAI_TPM = int(os.getenv("OPENAI_TPM", "30000"))
+# Completion tokens reserved per call on top of the prompt estimate
+OPENAI_COMPLETION_TOKENS = int(os.getenv("OPENAI_COMPLETION_TOKENS", "600"))
+# Gmail per-user quota (units per second)
+GMAIL_QUOTA_PER_SECOND = int(os.getenv("GMAIL_QUOTA_PER_SECOND", "250"))
+# Share of it background jobs (sent-mail ingestion) may use; they only run when user calls leave headroom
+GMAIL_BACKGROUND_QUOTA_PER_SECOND = int(os.getenv("GMAIL_BACKGROUND_QUOTA_PER_SECOND", "50"))
+
+# Quota units per Gmail method; unlisted methods are charged DEFAULT_GMAIL_UNITS
+GMAIL_QUOTA_UNITS = {
+    "gmail.users.getProfile": 1,
+    "gmail.users.history.list": 2,
+    "gmail.users.messages.list": 5,
+    "gmail.users.messages.get": 5,
+    "gmail.users.messages.attachments.get": 5,
+    "gmail.users.messages.modify": 5,
+    "gmail.users.threads.get": 10,
+    "gmail.users.messages.send": 100,
+}
+DEFAULT_GMAIL_UNITS = 5
+
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count (about four characters per token)"""
+    return len(text) // 4 + 1
+
+
+class TokenBucket:
+    """
+    Token bucket that refills continuously at rate per second up to capacity.
+    Callers reserve tokens up front and are told how long to wait, so waiters
+    are served in arrival order and the bucket can go into debt for large requests.
+    """
+
+    def __init__(self, name: str, rate: float, capacity: float):
+        self.name = name
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+        self.granted = 0
+        self.waited = 0.0
+
+    def reserve(self, amount: float) -> float:
+        """Take amount tokens and return the seconds to wait before using them"""
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            self._tokens -= amount
+            self.granted += amount
+            delay = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited += delay
+            return delay
+
+    def take(self, amount: float, keep: float = 0) -> float:
+        """
+        Take amount tokens only if at least keep tokens are left afterwards (amount + keep
+        must not exceed capacity); otherwise take nothing and return the seconds until it would
+        """
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+            self._updated = now
+            if self._tokens - amount < keep:
+                return (amount + keep - self._tokens) / self.rate
+            self._tokens -= amount
+            self.granted += amount
+            return 0.0
+
+    def acquire(self, amount: float = 1):
+        time.sleep(self.reserve(amount))
+
+    async def acquire_async(self, amount: float = 1):
+        await asyncio.sleep(self.reserve(amount))
+
+    def stats(self) -> dict:
+        with self._lock:
+            available = min(self.capacity, self._tokens + (time.monotonic() - self._updated) * self.rate)
+        return {
+            "rate_per_second": round(self.rate, 3),
+            "capacity": self.capacity,
+            "available": round(available, 1),
+            "granted": self.granted,
+            "waited_seconds": round(self.waited, 3)
+        }
+
+
+class OpenAILimiter:
+    """Requests-per-minute and tokens-per-minute buckets charged together for each completion"""
+
+    def __init__(self, rpm: int = OPENAI_RPM, tpm: int = OPENAI_TPM,
+                 completion_tokens: int = OPENAI_COMPLETION_TOKENS):
+        self.requests = TokenBucket("requests", rpm / 60, rpm)
+        self.tokens = TokenBucket("tokens", tpm / 60, tpm)
+        self.completion_tokens = completion_tokens
+
+    def _reserve(self, prompt: str) -> float:
+        cost = estimate_tokens(prompt) + self.completion_tokens
+        return max(self.requests.reserve(1), self.tokens.reserve(cost))
+
+    def acquire(self, prompt: str):
+        time.sleep(self._reserve(prompt))
+
+    async def acquire_async(self, prompt: str):
+        await asyncio.sleep(self._reserve(prompt))
+
+    def stats(self) -> dict:
+        return {"requests": self.requests.stats(), "tokens": self.tokens.stats()}
+
+
+class GmailQuota:
+    """Charges Gmail quota units per call; a batch costs the sum of its parts"""
+
+    def __init__(self, units_per_second: int = GMAIL_QUOTA_PER_SECOND):
+        self.bucket = TokenBucket("gmail", units_per_second, units_per_second)
+
+    @staticmethod
+    def units(request) -> int:
+        parts = getattr(request, "_requests", None)
+        if parts is not None:
+            return sum(GmailQuota.units(part) for part in parts.values())
+        return GMAIL_QUOTA_UNITS.get(getattr(request, "methodId", None), DEFAULT_GMAIL_UNITS)
+
+    def acquire(self, request):
+        self.bucket.acquire(self.units(request))
+
+    def stats(self) -> dict:
+        return self.bucket.stats()
+
+
+class BackgroundGmailQuota(GmailQuota):
+    """
+    Lower-priority budget for background jobs: calls are paced to units_per_second and
+    then take their units from the shared quota piece by piece, only while half of it
+    stays free, so they never put it into debt ahead of user requests
+    """
+
+    def __init__(self, shared: GmailQuota, units_per_second: int = GMAIL_BACKGROUND_QUOTA_PER_SECOND):
+        super().__init__(units_per_second)
+        self.shared = shared
+        self.deferred = 0.0
+
+    def acquire(self, request):
+        units = self.units(request)
+        self.bucket.acquire(units)
+        keep = self.shared.bucket.capacity / 2
+        while units > 0:
+            piece = min(units, keep)
+            delay = self.shared.bucket.take(piece, keep)
+            if delay:
+                self.deferred += delay
+                time.sleep(delay)
+            else:
+                units -= piece
+
+    def stats(self) -> dict:
+        return {**self.bucket.stats(), "deferred_seconds": round(self.deferred, 3)}
+
+
+# Shared by every generation and Gmail call in this worker
+openai_limiter = OpenAILimiter()
+gmail_quota = GmailQuota()
+gmail_background_quota = BackgroundGmailQuota(gmail_quota)
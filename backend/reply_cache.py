@@ -0,0 +1,94 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+
+# Local cache directory shared by the on-disk stores
+CACHE_DIR = os.getenv("CACHE_DIR", ".cache")
+REPLY_CACHE_PATH = os.getenv("REPLY_CACHE_PATH", os.path.join(CACHE_DIR, "replies.sqlite3"))
+REPLY_CACHE_SIZE = int(os.getenv("REPLY_CACHE_SIZE", "512"))
+REPLY_CACHE_TTL = int(os.getenv("REPLY_CACHE_TTL", str(7 * 24 * 3600)))
+
+
+def reply_cache_key(*parts) -> str:
+    """SHA-256 over every input that can change the generated reply"""
+    payload = json.dumps(parts, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ReplyCache:
+    """
+    Two-tier cache of generated replies: an in-memory LRU with TTL in front of
+    a SQLite table that survives restarts. Safe to share across threads.
+    """
+
+    def __init__(self, path: str = REPLY_CACHE_PATH, max_entries: int = REPLY_CACHE_SIZE,
+                 ttl: int = REPLY_CACHE_TTL):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._db = sqlite3.connect(path, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS replies (key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def _remember(self, key: str, value: dict, created: float):
+        self._memory[key] = (created, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key: str):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry and now - entry[0] < self.ttl:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return entry[1]
+            self._memory.pop(key, None)
+
+            row = self._db.execute("SELECT value, created FROM replies WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] < self.ttl:
+                value = json.loads(row[0])
+                self._remember(key, value, row[1])
+                self.disk_hits += 1
+                return value
+            if row:
+                self._db.execute("DELETE FROM replies WHERE key = ?", (key,))
+                self._db.commit()
+            self.misses += 1
+            return None
+
+    def set(self, key: str, value: dict):
+        now = time.time()
+        with self._lock:
+            self._remember(key, value, now)
+            self._db.execute(
+                "INSERT OR REPLACE INTO replies (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(value), now)
+            )
+            self._db.commit()
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_entries": len(self._memory),
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": round((self.memory_hits + self.disk_hits) / lookups, 3) if lookups else 0.0
+        }
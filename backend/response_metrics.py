@@ -0,0 +1,137 @@
+import os
+import gzip
+import json
+import time
+import threading
+
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+
+import metrics
+
+try:
+    import orjson
+except ImportError:  # optional: falls back to the standard library encoder
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# JSON bodies smaller than this are sent uncompressed
+COMPRESS_MIN_BYTES = int(os.getenv("COMPRESS_MIN_BYTES", "1024"))
+GZIP_LEVEL = int(os.getenv("GZIP_LEVEL", "6"))
+BROTLI_QUALITY = int(os.getenv("BROTLI_QUALITY", "5"))
+
+
+class ResponseMetrics:
+    """Per-route response sizes (before and after compression) and encoding time"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.endpoints = {}
+
+    def _entry(self, name: str) -> dict:
+        return self.endpoints.setdefault(name, {
+            "responses": 0, "json_bytes": 0, "max_json_bytes": 0, "serialize_seconds": 0.0,
+            "compressed": 0, "wire_bytes": 0, "compress_seconds": 0.0
+        })
+
+    def record_json(self, name: str, size: int, seconds: float):
+        metrics.RESPONSE_BYTES.labels(name, "identity").observe(size)
+        with self._lock:
+            entry = self._entry(name)
+            entry["responses"] += 1
+            entry["json_bytes"] += size
+            entry["max_json_bytes"] = max(entry["max_json_bytes"], size)
+            entry["serialize_seconds"] += seconds
+
+    def record_compression(self, name: str, encoding: str, size: int, seconds: float):
+        metrics.RESPONSE_BYTES.labels(name, encoding).observe(size)
+        with self._lock:
+            entry = self._entry(name)
+            entry["compressed"] += 1
+            entry["wire_bytes"] += size
+            entry["compress_seconds"] += seconds
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                name: {**entry,
+                       "serialize_seconds": round(entry["serialize_seconds"], 6),
+                       "compress_seconds": round(entry["compress_seconds"], 6)}
+                for name, entry in self.endpoints.items()
+            }
+
+
+response_metrics = ResponseMetrics()
+
+
+def dumps(payload) -> bytes:
+    if orjson is not None:
+        return orjson.dumps(payload)
+    return json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def json_response(payload, name: str, status_code: int = 200) -> Response:
+    """Serialize with orjson when installed and record body size and encoding time under the route name"""
+    start = time.perf_counter()
+    with metrics.stage("serialize"):
+        body = dumps(payload)
+    response_metrics.record_json(name, len(body), time.perf_counter() - start)
+    return Response(body, status_code=status_code, media_type="application/json")
+
+
+class CompressionMiddleware:
+    """
+    Compresses complete JSON bodies above minimum_size with brotli (when installed and
+    accepted) or gzip. Files, Range responses and event streams pass through untouched.
+    """
+
+    def __init__(self, app, minimum_size: int = COMPRESS_MIN_BYTES):
+        self.app = app
+        self.minimum_size = minimum_size
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        accept = Headers(scope=scope).get("accept-encoding", "")
+        encoding = "br" if brotli is not None and "br" in accept else "gzip" if "gzip" in accept else None
+        if encoding is None:
+            await self.app(scope, receive, send)
+            return
+
+        held = None
+
+        async def send_compressed(message):
+            nonlocal held
+            if message["type"] == "http.response.start":
+                headers = Headers(raw=message["headers"])
+                if headers.get("content-type", "").startswith("application/json") \
+                        and "content-encoding" not in headers:
+                    # Hold the headers until the body size is known
+                    held = message
+                    return
+            elif message["type"] == "http.response.body" and held is not None:
+                start, held = held, None
+                body = message.get("body", b"")
+                if len(body) >= self.minimum_size and not message.get("more_body", False):
+                    began = time.perf_counter()
+                    body = (brotli.compress(body, quality=BROTLI_QUALITY) if encoding == "br"
+                            else gzip.compress(body, compresslevel=GZIP_LEVEL))
+                    # Route template, so ids in the path do not each get an entry
+                    route = scope.get("route")
+                    response_metrics.record_compression(
+                        getattr(route, "path", scope["path"]), encoding, len(body), time.perf_counter() - began
+                    )
+                    headers = MutableHeaders(raw=start["headers"])
+                    headers["Content-Encoding"] = encoding
+                    headers["Content-Length"] = str(len(body))
+                    headers.add_vary_header("Accept-Encoding")
+                    message = {**message, "body": body}
+                await send(start)
+            await send(message)
+
+        await self.app(scope, receive, send_compressed)
@@ -0,0 +1,332 @@
+import os
+import re
+import json
+import time
+import struct
+import sqlite3
+import threading
+
+from googleapiclient.errors import HttpError
+
+from reply_cache import CACHE_DIR
+from gmail_batch import batch_get_threads, get_header, message_text, GMAIL_MAX_PAGE_SIZE
+
+SENT_CORPUS_ENABLED = os.getenv("SENT_CORPUS_ENABLED", "1") == "1"
+SENT_CORPUS_DIR = os.getenv("SENT_CORPUS_DIR", os.path.join(CACHE_DIR, "sent_corpus"))
+# Sent mail considered on the first ingestion; later runs follow the history API
+SENT_CORPUS_QUERY = os.getenv("SENT_CORPUS_QUERY", "newer_than:365d")
+SENT_CORPUS_FULL_LIMIT = int(os.getenv("SENT_CORPUS_FULL_LIMIT", "5000"))
+# Seconds between background ingestion runs
+SENT_CORPUS_INTERVAL = float(os.getenv("SENT_CORPUS_INTERVAL", "600"))
+# Embedding width; 256 float16 values is 512 bytes per pair
+SENT_CORPUS_DIM = int(os.getenv("SENT_CORPUS_DIM", "256"))
+# Threads fetched and appended per step, bounding memory during large ingestions
+SENT_CORPUS_CHUNK = int(os.getenv("SENT_CORPUS_CHUNK", "100"))
+# Extra rounds for threads whose batch part failed (e.g. a 429 inside the batch)
+SENT_CORPUS_FETCH_RETRIES = int(os.getenv("SENT_CORPUS_FETCH_RETRIES", "3"))
+# Rows scored per slice of the memory map during search
+SENT_CORPUS_SCAN_ROWS = int(os.getenv("SENT_CORPUS_SCAN_ROWS", "16384"))
+# Characters kept per side of a pair
+SENT_CORPUS_MAX_CHARS = 2000
+
+THREAD_FIELDS = "messages(id,threadId,internalDate,labelIds,snippet,payload)"
+_QUOTE_START = re.compile(r"^(On .+ wrote:|-+ ?Original Message ?-+|From: .+)$", re.MULTILINE)
+
+
+def strip_quoted(text: str) -> str:
+    """Drop the quoted history Gmail appends below a reply"""
+    match = _QUOTE_START.search(text)
+    if match:
+        text = text[:match.start()]
+    return "\n".join(line for line in text.splitlines() if not line.startswith(">")).strip()
+
+
+class SentCorpus:
+    """
+    Reply pairs (the email answered -> what the user sent) mined from the SENT label.
+    Storage is append-only and memory-mapped, so resident memory does not grow with the corpus:
+      vectors.f16  - float16 [rows, SENT_CORPUS_DIM] hashed embeddings of the answered email
+      offsets.u64  - uint64 [rows, 2] (start, length) of each pair's JSON record
+      records.bin  - concatenated JSON records
+    A row becomes visible once its offsets entry is written. Ingested message ids
+    and the Gmail historyId live in SQLite so re-ingestion only touches new sent mail.
+    """
+
+    def __init__(self, gmail, root: str = SENT_CORPUS_DIR, dim: int = SENT_CORPUS_DIM):
+        self.gmail = gmail
+        self.root = root
+        self.dim = dim
+        self._append_lock = threading.Lock()
+        self._sync_lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._vectorizer = None
+        self.last_sync = 0.0
+        self.messages_seen = 0
+        self.pairs_added = 0
+        self.searches = 0
+
+        os.makedirs(root, exist_ok=True)
+        self._vectors_path = os.path.join(root, "vectors.f16")
+        self._offsets_path = os.path.join(root, "offsets.u64")
+        self._records_path = os.path.join(root, "records.bin")
+        self._db = sqlite3.connect(os.path.join(root, "state.sqlite3"), check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("CREATE TABLE IF NOT EXISTS ingested (id TEXT PRIMARY KEY)")
+        self._db.execute("CREATE TABLE IF NOT EXISTS sync_state (key TEXT PRIMARY KEY, value TEXT)")
+        self._db.commit()
+        self._repair()
+
+    # Storage
+
+    def __len__(self) -> int:
+        try:
+            return os.path.getsize(self._offsets_path) // 16
+        except FileNotFoundError:
+            return 0
+
+    def _repair(self):
+        """Cut vectors and records written after the last committed offsets entry (interrupted append)"""
+        rows = len(self)
+        end = 0
+        if rows:
+            with open(self._offsets_path, "rb") as f:
+                f.seek((rows - 1) * 16)
+                start, length = struct.unpack("<QQ", f.read(16))
+            end = start + length
+        for path, size in ((self._vectors_path, rows * self.dim * 2), (self._records_path, end)):
+            with open(path, "ab") as f:
+                if f.tell() > size:
+                    f.truncate(size)
+        with open(self._offsets_path, "ab") as f:
+            f.truncate(rows * 16)
+
+    def _embed(self, texts: list):
+        import numpy as np
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        if self._vectorizer is None:
+            # Signed hashing straight into a small dense space acts as a random projection
+            self._vectorizer = HashingVectorizer(n_features=self.dim, ngram_range=(1, 2), stop_words="english",
+                                                 alternate_sign=True, norm="l2", dtype=np.float32)
+        return self._vectorizer.transform(texts).toarray()
+
+    def append(self, pairs: list):
+        """Append (context, reply, meta) records and their context embeddings"""
+        import numpy as np
+
+        if not pairs:
+            return
+        vectors = self._embed([p["context"] for p in pairs]).astype(np.float16)
+        with self._append_lock:
+            with open(self._records_path, "ab") as f:
+                start = f.tell()
+                spans = []
+                for pair in pairs:
+                    blob = json.dumps(pair, ensure_ascii=False).encode("utf-8")
+                    f.write(blob)
+                    spans.append((start, len(blob)))
+                    start += len(blob)
+            with open(self._vectors_path, "ab") as f:
+                f.write(vectors.tobytes())
+            # Written last: publishes the new rows to readers
+            with open(self._offsets_path, "ab") as f:
+                f.write(np.asarray(spans, dtype=np.uint64).tobytes())
+        self.pairs_added += len(pairs)
+
+    def _record(self, fd: int, start: int, length: int) -> dict:
+        return json.loads(os.pread(fd, length, start).decode("utf-8"))
+
+    def search(self, text: str, k: int = 3, min_score: float = 0.05) -> list:
+        """Top-k pairs whose answered email is most similar to text, scanning the memory map in slices"""
+        import numpy as np
+
+        rows = len(self)
+        self.searches += 1
+        if not rows or k <= 0:
+            return []
+        query = self._embed([text[-1500:]])[0].astype(np.float32)
+        if not query.any():
+            return []
+        vectors = np.memmap(self._vectors_path, dtype=np.float16, mode="r", shape=(rows, self.dim))
+        best_rows = np.empty(0, dtype=np.int64)
+        best_scores = np.empty(0, dtype=np.float32)
+        for start in range(0, rows, SENT_CORPUS_SCAN_ROWS):
+            scores = vectors[start:start + SENT_CORPUS_SCAN_ROWS].astype(np.float32) @ query
+            take = min(k, len(scores))
+            top = np.argpartition(-scores, take - 1)[:take]
+            best_rows = np.concatenate([best_rows, top + start])
+            best_scores = np.concatenate([best_scores, scores[top]])
+            keep = np.argsort(-best_scores)[:k]
+            best_rows, best_scores = best_rows[keep], best_scores[keep]
+        del vectors
+
+        offsets = np.memmap(self._offsets_path, dtype=np.uint64, mode="r", shape=(rows, 2))
+        fd = os.open(self._records_path, os.O_RDONLY)
+        try:
+            return [
+                {**self._record(fd, int(offsets[row, 0]), int(offsets[row, 1])), "score": round(float(score), 4)}
+                for row, score in zip(best_rows, best_scores) if score >= min_score
+            ]
+        finally:
+            os.close(fd)
+
+    # Ingestion
+
+    def _get_state(self, key: str):
+        with self._db_lock:
+            row = self._db.execute("SELECT value FROM sync_state WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def _set_state(self, key: str, value: str):
+        with self._db_lock:
+            self._db.execute("INSERT OR REPLACE INTO sync_state (key, value) VALUES (?, ?)", (key, value))
+            self._db.commit()
+
+    def _new_ids(self, message_ids: list) -> set:
+        with self._db_lock:
+            seen = set()
+            for start in range(0, len(message_ids), 500):
+                chunk = message_ids[start:start + 500]
+                seen.update(row[0] for row in self._db.execute(
+                    f"SELECT id FROM ingested WHERE id IN ({','.join('?' * len(chunk))})", chunk
+                ))
+        return set(message_ids) - seen
+
+    def _mark_ingested(self, message_ids: list):
+        with self._db_lock:
+            self._db.executemany("INSERT OR IGNORE INTO ingested (id) VALUES (?)", [(i,) for i in message_ids])
+            self._db.commit()
+
+    @staticmethod
+    def pair_for(sent: dict, thread: list):
+        """Pair a sent message with the message it answered, or None when it is not a reply"""
+        headers = sent.get("payload", {}).get("headers", [])
+        in_reply_to = get_header(headers, "In-Reply-To")
+        answered = None
+        if in_reply_to:
+            answered = next((m for m in thread
+                             if get_header(m.get("payload", {}).get("headers", []), "Message-ID") == in_reply_to), None)
+        if answered is None:
+            earlier = [m for m in thread
+                       if int(m.get("internalDate", 0)) < int(sent.get("internalDate", 0))
+                       and "SENT" not in m.get("labelIds", [])]
+            answered = earlier[-1] if earlier else None
+        if answered is None:
+            return None
+
+        reply = strip_quoted(message_text(sent.get("payload", {})) or sent.get("snippet", ""))
+        context = strip_quoted(message_text(answered.get("payload", {})) or answered.get("snippet", ""))
+        if not reply or not context:
+            return None
+        return {
+            "context": context[:SENT_CORPUS_MAX_CHARS],
+            "reply": reply[:SENT_CORPUS_MAX_CHARS],
+            "id": sent["id"],
+            "date": sent.get("internalDate")
+        }
+
+    def _fetch_threads(self, thread_ids: list) -> dict:
+        """
+        {thread_id: thread}, retrying threads whose batch part failed. Raises if any still
+        fail, so syncs do not advance history_id past mail that was never ingested.
+        """
+        threads, pending = {}, list(thread_ids)
+        for attempt in range(SENT_CORPUS_FETCH_RETRIES + 1):
+            if attempt:
+                time.sleep(2 ** (attempt - 1))
+            failed = {}
+            results = batch_get_threads(self.gmail, pending, fields=THREAD_FIELDS, errors=failed)
+            threads.update((thread_id, thread) for thread_id, thread in zip(pending, results) if thread)
+            # A 404 means the thread was deleted after it was listed: nothing to ingest
+            pending = [thread_id for thread_id, error in failed.items()
+                       if not (isinstance(error, HttpError) and error.resp.status == 404)]
+            if not pending:
+                return threads
+        raise failed[pending[0]]
+
+    def ingest(self, sent: list):
+        """Ingest [(message_id, thread_id)] of sent mail, skipping ids already processed"""
+        fresh = self._new_ids([message_id for message_id, _ in sent])
+        by_thread = {}
+        for message_id, thread_id in sent:
+            if message_id in fresh:
+                by_thread.setdefault(thread_id, set()).add(message_id)
+
+        thread_ids = list(by_thread)
+        for start in range(0, len(thread_ids), SENT_CORPUS_CHUNK):
+            chunk = thread_ids[start:start + SENT_CORPUS_CHUNK]
+            pairs, done = [], []
+            for thread_id, thread in self._fetch_threads(chunk).items():
+                messages = sorted(thread.get("messages", []), key=lambda m: int(m.get("internalDate", 0)))
+                for message in messages:
+                    if message["id"] in by_thread[thread_id]:
+                        pair = self.pair_for(message, messages)
+                        if pair:
+                            pairs.append(pair)
+                        done.append(message["id"])
+            self.append(pairs)
+            self._mark_ingested(done)
+            self.messages_seen += len(done)
+
+    def full_sync(self):
+        """Walk SENT_CORPUS_QUERY in the SENT label; already ingested mail is skipped"""
+        history_id = self.gmail.execute(self.gmail.users().getProfile(userId="me"))["historyId"]
+        sent, page_token = [], None
+        while len(sent) < SENT_CORPUS_FULL_LIMIT:
+            kwargs = {"userId": "me", "labelIds": ["SENT"], "q": SENT_CORPUS_QUERY,
+                      "maxResults": GMAIL_MAX_PAGE_SIZE}
+            if page_token:
+                kwargs["pageToken"] = page_token
+            response = self.gmail.execute(self.gmail.users().messages().list(**kwargs))
+            sent.extend((m["id"], m["threadId"]) for m in response.get("messages", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        self.ingest(sent[:SENT_CORPUS_FULL_LIMIT])
+        self._set_state("history_id", str(history_id))
+
+    def incremental_sync(self, history_id: str):
+        """Ingest mail added to SENT since history_id; raises HttpError 404 when the history has expired"""
+        sent, page_token, latest = [], None, history_id
+        while True:
+            kwargs = {"userId": "me", "startHistoryId": history_id, "labelId": "SENT",
+                      "historyTypes": ["messageAdded"], "maxResults": GMAIL_MAX_PAGE_SIZE}
+            if page_token:
+                kwargs["pageToken"] = page_token
+            response = self.gmail.execute(self.gmail.users().history().list(**kwargs))
+            for record in response.get("history", []):
+                for item in record.get("messagesAdded", []):
+                    message = item["message"]
+                    if "SENT" in message.get("labelIds", ["SENT"]):
+                        sent.append((message["id"], message["threadId"]))
+            latest = response.get("historyId", latest)
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+        self.ingest(sent)
+        self._set_state("history_id", str(latest))
+
+    def sync(self):
+        with self._sync_lock:
+            history_id = self._get_state("history_id")
+            if history_id is None:
+                self.full_sync()
+            else:
+                try:
+                    self.incremental_sync(history_id)
+                except HttpError as e:
+                    if e.resp.status != 404:
+                        raise
+                    self.full_sync()
+            self.last_sync = time.time()
+
+    def stats(self) -> dict:
+        return {
+            "pairs": len(self),
+            "bytes": sum(os.path.getsize(p) for p in (self._vectors_path, self._offsets_path, self._records_path)),
+            "history_id": self._get_state("history_id"),
+            "last_sync": self.last_sync,
+            "messages_seen": self.messages_seen,
+            "pairs_added": self.pairs_added,
+            "searches": self.searches
+        }
@@ -0,0 +1,20 @@
+import json
+
+# Headers that keep proxies from buffering the event stream
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "Connection": "keep-alive",
+    "X-Accel-Buffering": "no"
+}
+
+
+def sse_event(event: str, data) -> str:
+    """Format one Server-Sent Event with a JSON payload"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def stream_pass(llm, system_message: str, prompt: str, event: str, parts: list, agent: str = "writer"):
+    """Stream one completion through the LLM gateway as SSE token events, collecting the tokens into parts"""
+    async for token in llm.stream(system_message, prompt, agent):
+        parts.append(token)
+        yield sse_event(event, {"token": token})
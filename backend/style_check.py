@@ -0,0 +1,38 @@
+import os
+import re
+
+# Word limit used for "concise"/"short" length rules
+STYLE_MAX_WORDS = int(os.getenv("STYLE_MAX_WORDS", "150"))
+
+# Template slots the writer leaves behind, e.g. "[Your Name]" or "[Recipient's Name]"
+PLACEHOLDER_PATTERN = re.compile(r"\[(your|recipient|name|company|date)[^\]]*\]", re.IGNORECASE)
+
+
+def _normalize(text: str) -> str:
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+def check_style(text: str, style: dict, max_words: int = STYLE_MAX_WORDS) -> list:
+    """
+    Cheap local check of a reply against the style profile.
+    Returns a list of human-readable issues; an empty list means the reply conforms.
+    """
+    issues = []
+    normalized = _normalize(text)
+
+    signature = style.get("preferred_signature")
+    if signature and not normalized.endswith(_normalize(signature)):
+        issues.append("missing preferred signature")
+
+    length_rule = style.get("length", "").lower()
+    if ("concise" in length_rule or "short" in length_rule) and len(text.split()) > max_words:
+        issues.append(f"longer than {max_words} words")
+
+    for phrase in style.get("phrases_to_avoid", []):
+        if phrase.lower() in normalized:
+            issues.append(f"uses avoided phrase '{phrase}'")
+
+    if PLACEHOLDER_PATTERN.search(text):
+        issues.append("contains template placeholders")
+
+    return issues
@@ -0,0 +1,138 @@
+import os
+import json
+import hashlib
+import threading
+
+from reply_cache import CACHE_DIR
+
+STYLE_EXAMPLES_PATH = os.getenv(
+    "STYLE_EXAMPLES_PATH", os.path.join(os.path.dirname(os.path.abspath(__file__)), "email_style_examples.json")
+)
+STYLE_INDEX_DIR = os.getenv("STYLE_INDEX_DIR", os.path.join(CACHE_DIR, "style_index"))
+# Examples injected per prompt
+STYLE_EXAMPLES_K = int(os.getenv("STYLE_EXAMPLES_K", "3"))
+# Model tokens allowed for all injected examples together, on top of CONTEXT_TOKEN_BUDGET
+STYLE_EXAMPLES_TOKEN_BUDGET = int(os.getenv("STYLE_EXAMPLES_TOKEN_BUDGET", "600"))
+# Cosine similarity below which an example is not considered related
+STYLE_MIN_SCORE = float(os.getenv("STYLE_MIN_SCORE", "0.05"))
+# Query terms found in more than this share of examples are too common to rank by
+STYLE_MAX_DF = float(os.getenv("STYLE_MAX_DF", "0.2"))
+# Only the tail of long inputs is used as the query: the latest message comes last
+STYLE_QUERY_CHARS = int(os.getenv("STYLE_QUERY_CHARS", "1500"))
+# Bump when the vectorizer settings change so persisted matrices are rebuilt
+STYLE_INDEX_FORMAT = "hash20-12gram-en"
+
+
+class StyleExampleIndex:
+    """
+    Retrieves the context->reply pairs most similar to an incoming email.
+    Contexts are embedded once with a stateless hashing vectorizer and the matrix
+    is persisted next to the cache, keyed by the examples file's hash, so restarts
+    only reload it. Lookups read the columns of the query's terms from a
+    term-major copy of the matrix, so cost scales with matching examples only.
+    """
+
+    def __init__(self, path: str = STYLE_EXAMPLES_PATH, index_dir: str = STYLE_INDEX_DIR):
+        self.path = path
+        self.index_dir = index_dir
+        self.examples = []
+        self.version = None
+        self._by_term = None
+        self._vectorizer = None
+        self._analyze = None
+        self._lock = threading.Lock()
+        self.lookups = 0
+
+    def _load(self):
+        import numpy as np
+        from scipy import sparse
+        from sklearn.feature_extraction.text import HashingVectorizer
+
+        self._vectorizer = HashingVectorizer(n_features=2 ** 20, ngram_range=(1, 2), stop_words="english",
+                                             alternate_sign=False, norm="l2", dtype=np.float32)
+        self._analyze = self._vectorizer.build_analyzer()
+        try:
+            with open(self.path, "rb") as f:
+                raw = f.read()
+        except FileNotFoundError:
+            self.examples, self.version = [], "none"
+            self._by_term = sparse.csr_matrix((self._vectorizer.n_features, 0), dtype=np.float32)
+            return
+
+        self.version = hashlib.sha256(raw).hexdigest()[:16]
+        self.examples = [e for e in json.loads(raw) if e.get("context") and e.get("reply")]
+        cached = os.path.join(self.index_dir, f"{self.version}-{STYLE_INDEX_FORMAT}.npz")
+        if os.path.exists(cached):
+            self._by_term = sparse.load_npz(cached).tocsr()
+            return
+
+        # Rows are terms, columns are examples
+        matrix = self._vectorizer.transform([e["context"] for e in self.examples])
+        self._by_term = matrix.T.tocsr()
+        os.makedirs(self.index_dir, exist_ok=True)
+        tmp = f"{cached}.{threading.get_ident()}.tmp.npz"
+        sparse.save_npz(tmp, self._by_term)
+        os.replace(tmp, cached)
+
+    def load(self):
+        if self._by_term is None:
+            with self._lock:
+                if self._by_term is None:
+                    self._load()
+        return self
+
+    def _query_vector(self, text: str) -> tuple:
+        """(feature indices, l2-normalized weights); same as the vectorizer's transform without its per-call overhead"""
+        import numpy as np
+        from sklearn.utils import murmurhash3_32
+
+        n_features = self._vectorizer.n_features
+        hashed = np.fromiter((abs(murmurhash3_32(term, seed=0)) % n_features for term in self._analyze(text)),
+                             dtype=np.int64)
+        indices, counts = np.unique(hashed, return_counts=True)
+        weights = counts.astype(np.float32)
+        return indices, weights / (np.linalg.norm(weights) or 1)
+
+    def search(self, text: str, k: int = STYLE_EXAMPLES_K, min_score: float = STYLE_MIN_SCORE) -> list:
+        """Top-k examples as dicts with context, reply and score, most similar first"""
+        import numpy as np
+
+        self.load()
+        self.lookups += 1
+        if not self.examples or k <= 0:
+            return []
+        indices, weights = self._query_vector(text[-STYLE_QUERY_CHARS:])
+        df = self._by_term.indptr[indices + 1] - self._by_term.indptr[indices]
+        common = df > max(STYLE_MAX_DF * len(self.examples), 10)
+        postings = self._by_term[indices[~common]]
+        if not postings.nnz:
+            return []
+        # Weighted sum of the query terms' postings gives each example's cosine score
+        # (minus the skipped common terms)
+        scores = np.bincount(postings.indices, minlength=len(self.examples),
+                             weights=np.repeat(weights[~common], np.diff(postings.indptr)) * postings.data)
+        k = min(k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [
+            {**self.examples[i], "score": round(float(scores[i]), 4)}
+            for i in top if scores[i] >= min_score
+        ]
+
+    def stats(self) -> dict:
+        return {"examples": len(self.examples), "version": self.version, "lookups": self.lookups}
+
+
+def format_examples(examples: list, counter=None, budget: int = STYLE_EXAMPLES_TOKEN_BUDGET) -> str:
+    """
+    Prompt section showing how similar emails were answered. With a TokenCounter, each
+    pair gets an equal share of budget, two thirds of it for the reply that carries the style.
+    """
+    if not examples:
+        return ""
+    if counter:
+        per_pair = budget // len(examples)
+        examples = [{"context": counter.truncate(e["context"], per_pair // 3),
+                     "reply": counter.truncate(e["reply"], per_pair - per_pair // 3)} for e in examples]
+    pairs = "\n\n".join(f"Email: {e['context']}\nReply: {e['reply']}" for e in examples)
+    return f"\n\nExamples of how I have replied to similar emails (match their tone and length):\n{pairs}"
@@ -0,0 +1,133 @@
+import os
+import re
+
+import numpy as np
+from scipy import sparse
+from sklearn.cluster import MiniBatchKMeans
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+
+# Sentences vectorized per chunk; bounds peak memory on very long documents
+SUMMARY_CHUNK_SENTENCES = int(os.getenv("SUMMARY_CHUNK_SENTENCES", "4000"))
+# Sentences shorter than this many words are never picked (headers, page numbers)
+SUMMARY_MIN_WORDS = int(os.getenv("SUMMARY_MIN_WORDS", "4"))
+
+# Documents with more sentences than this are summarized map-reduce style: each
+# chunk of this many sentences contributes SUMMARY_CHUNK_PASSAGES key passages
+# to the next level until the candidates fit in one chunk
+SUMMARY_MAP_SENTENCES = int(os.getenv("SUMMARY_MAP_SENTENCES", "2000"))
+SUMMARY_CHUNK_PASSAGES = int(os.getenv("SUMMARY_CHUNK_PASSAGES", "20"))
+# Hashed features are folded to this many dimensions for clustering so centroids stay small and dense
+SUMMARY_CLUSTER_FEATURES = 2 ** 12
+
+# Pivot for length normalization: 0 ignores length, 1 scores the mean term weight
+SUMMARY_LENGTH_SLOPE = float(os.getenv("SUMMARY_LENGTH_SLOPE", "0.9"))
+
+# Stateless: hashing needs no vocabulary, so nothing is fitted per call and
+# the same instance is safe to share across threads and process-pool workers.
+# No stop-word list: idf already discounts common words and filtering costs a Python pass per token
+_vectorizer = HashingVectorizer(
+    n_features=2 ** 18,
+    alternate_sign=False,
+    norm=None,
+    dtype=np.float32
+)
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+(?=[\"'(\[A-Z0-9])|\n\s*\n")
+
+
+def split_sentences(text: str) -> list:
+    """Regex sentence splitter; much cheaper than a trained tokenizer on long PDFs"""
+    return [s.strip() for s in _SENTENCE_END.split(text) if s.strip()]
+
+
+def weigh_sentences(sentences: list, chunk_size: int = SUMMARY_CHUNK_SENTENCES) -> tuple:
+    """
+    (sparse TF-IDF rows, importance score per sentence). Scores use pivoted length
+    normalization (the sum is divided by the sentence's distinct term count relative to
+    the average), so long sentences are not favored just for being long.
+    Document frequencies are accumulated chunk by chunk over the hashed features.
+    """
+    if not sentences:
+        return sparse.csr_matrix((0, _vectorizer.n_features), dtype=np.float32), np.zeros(0)
+    chunks = [_vectorizer.transform(sentences[i:i + chunk_size]) for i in range(0, len(sentences), chunk_size)]
+    df = np.zeros(_vectorizer.n_features, dtype=np.float32)
+    for matrix in chunks:
+        df += np.bincount(matrix.indices, minlength=_vectorizer.n_features)
+    idf = np.log((1 + len(sentences)) / (1 + df)) + 1
+
+    mean_terms = max(sum(matrix.nnz for matrix in chunks) / len(sentences), 1)
+    scores = []
+    for matrix in chunks:
+        # Sublinear term frequency, then weight each nonzero by its feature's idf
+        matrix.data = (1 + np.log(matrix.data)) * idf[matrix.indices]
+        pivot = (1 - SUMMARY_LENGTH_SLOPE) + SUMMARY_LENGTH_SLOPE * np.diff(matrix.indptr) / mean_terms
+        scores.append(np.asarray(matrix.sum(axis=1)).ravel() / pivot)
+    return sparse.vstack(chunks, format="csr"), np.concatenate(scores)
+
+
+def fold(matrix, n_features: int = SUMMARY_CLUSTER_FEATURES):
+    """Fold hashed columns modulo n_features and l2-normalize rows; stays sparse"""
+    folded = sparse.csr_matrix((matrix.data, matrix.indices % n_features, matrix.indptr),
+                               shape=(matrix.shape[0], n_features))
+    folded.sum_duplicates()
+    return normalize(folded)
+
+
+def key_passages(matrix, scores: np.ndarray, k: int) -> np.ndarray:
+    """
+    Row indices of up to k passages covering different topics: rows are clustered with
+    MiniBatchKMeans on sparse input, seeded with the k highest-scoring rows, and each
+    cluster contributes the row that best combines closeness to its centroid with its
+    own importance score.
+    """
+    if matrix.shape[0] <= k:
+        return np.arange(matrix.shape[0])
+    rows = fold(matrix)
+    seeds = rows[np.argpartition(-scores, k - 1)[:k]].toarray()
+    kmeans = MiniBatchKMeans(n_clusters=k, init=seeds, batch_size=1024, n_init=1, max_iter=10,
+                             max_no_improvement=3, random_state=0).fit(rows)
+    # Cosine to the assigned centroid from a sparse x dense product; rows are never densified
+    closeness = np.asarray(rows @ kmeans.cluster_centers_.T)[np.arange(rows.shape[0]), kmeans.labels_]
+    rank = closeness * scores / (scores.max() or 1)
+    order = np.lexsort((-rank, kmeans.labels_))
+    labels = kmeans.labels_[order]
+    return order[np.r_[True, labels[1:] != labels[:-1]]]
+
+
+def map_reduce(matrix, scores: np.ndarray, candidates: np.ndarray, max_sentences: int,
+               chunk_size: int = SUMMARY_MAP_SENTENCES) -> np.ndarray:
+    """
+    Reduce candidates (row indices of matrix) chunk by chunk to their key passages, level
+    after level, until one chunk remains; then pick max_sentences from it. Every level
+    shrinks the candidates by chunk_size / SUMMARY_CHUNK_PASSAGES, so work is linear in the
+    document and dense memory is bounded by one chunk.
+    """
+    per_chunk = max(SUMMARY_CHUNK_PASSAGES, max_sentences)
+    while len(candidates) > chunk_size:
+        kept = []
+        for start in range(0, len(candidates), chunk_size):
+            chunk = candidates[start:start + chunk_size]
+            kept.append(chunk[key_passages(matrix[chunk], scores[chunk], per_chunk)])
+        candidates = np.sort(np.concatenate(kept))
+    return np.sort(candidates[key_passages(matrix[candidates], scores[candidates], max_sentences)])
+
+
+def summarize(text: str, max_sentences: int = 10) -> str:
+    """
+    Extractive summary in document order: the max_sentences highest-scoring sentences, or
+    for documents above SUMMARY_MAP_SENTENCES sentences, the key passages left after map-reduce
+    """
+    sentences = split_sentences(text)
+    if len(sentences) <= max_sentences:
+        return text
+
+    matrix, scores = weigh_sentences(sentences)
+    words = np.fromiter((s.count(" ") + 1 for s in sentences), dtype=np.int32, count=len(sentences))
+    if len(sentences) > SUMMARY_MAP_SENTENCES:
+        candidates = np.flatnonzero(words >= SUMMARY_MIN_WORDS)
+        if len(candidates) > max_sentences:
+            return " ".join(sentences[i] for i in map_reduce(matrix, scores, candidates, max_sentences))
+    scores[words < SUMMARY_MIN_WORDS] = -1
+    top = np.argpartition(-scores, max_sentences - 1)[:max_sentences]
+    return " ".join(sentences[i] for i in np.sort(top))
@@ -1,4 +1,4 @@
-import React, { useState, useEffect } from "react";
+import React, { useState, useEffect, useRef } from "react";
 import { FiMail, FiPaperclip, FiSend, FiLoader, FiCheckCircle, FiXCircle } from "react-icons/fi";
 
 export default function EmailResponder() {
@@ -8,9 +8,9 @@ export default function EmailResponder() {
   const [threadContext, setThreadContext] = useState([]);
   const [loading, setLoading] = useState(false);
   const [threadLoading, setThreadLoading] = useState(false);
-  const [attachmentLoadingId, setAttachmentLoadingId] = useState(null);
   const [toast, setToast] = useState(null);
   const [usedPdfFilename, setUsedPdfFilename] = useState("");
+  const streamRef = useRef(null);
 
   useEffect(() => {
     const fetchEmails = async () => {
@@ -34,24 +34,46 @@ export default function EmailResponder() {
     setThreadContext([]);
     setUsedPdfFilename("");
 
-    try {
-      const threadRes = await fetch(
-        `http://localhost:8000/generate_with_pdf?id=${email.id}`
-      );
-      const threadData = await threadRes.json();
-
-      setEditableResponse(threadData.response ?? "");
-      setThreadContext(threadData?.thread || []);
-      setUsedPdfFilename(threadData.pdfFilename || "");
+    // Stream the reply: thread context first, then draft tokens, then the styled reply
+    streamRef.current?.close();
+    const source = new EventSource(
+      `http://localhost:8000/generate_with_pdf/stream?id=${email.id}`
+    );
+    streamRef.current = source;
+    const finish = () => {
+      source.close();
+      setLoading(false);
+      setThreadLoading(false);
+    };
+
+    source.addEventListener("context", (e) => {
+      const data = JSON.parse(e.data);
+      setThreadContext(data.thread || []);
+      setUsedPdfFilename(data.pdfFilename || "");
+      setThreadLoading(false);
+    });
+    source.addEventListener("draft", (e) => {
+      setLoading(false);
+      setEditableResponse((prev) => prev + JSON.parse(e.data).token);
+    });
+    source.addEventListener("stage", (e) => {
+      if (JSON.parse(e.data).stage === "review") setEditableResponse("");
+    });
+    source.addEventListener("final", (e) => {
+      setLoading(false);
+      setEditableResponse((prev) => prev + JSON.parse(e.data).token);
+    });
+    source.addEventListener("done", (e) => {
+      setEditableResponse(JSON.parse(e.data).final_reply ?? "");
       showToast("Reply generated successfully", "success");
-    } catch (error) {
-      console.error("Error generating response:", error);
+      finish();
+    });
+    source.addEventListener("error", (e) => {
+      console.error("Error generating response:", e.data || e);
       showToast("Error generating response", "error");
       setEditableResponse("Error generating response.");
-    } finally {
-      setLoading(false);
-      setThreadLoading(false);
-    }
+      finish();
+    });
   };
 
   const sendEmail = async () => {
@@ -79,27 +101,11 @@ export default function EmailResponder() {
     }
   };
 
-  const fetchAttachment = async (messageId, attachmentId) => {
-    setAttachmentLoadingId(attachmentId);
-    try {
-      const res = await fetch(`http://localhost:8000/email/attachment/${messageId}/${attachmentId}`);
-      const data = await res.json();
-      if (data.pdf) {
-        const pdfWindow = window.open();
-        pdfWindow.document.write(`
-          <html>
-            <head><title>PDF Viewer</title><style>body { margin: 0; }</style></head>
-            <body>
-              <iframe src="data:application/pdf;base64,${data.pdf}" width="100%" height="100%" style="border: none;"></iframe>
-            </body>
-          </html>
-        `);
-      }
-    } catch (error) {
-      console.error("Error fetching attachment:", error);
+  const openAttachment = (messageId, attachmentId) => {
+    // The browser's PDF viewer streams the raw bytes and loads pages with Range requests
+    const pdfWindow = window.open(`http://localhost:8000/email/attachment/${messageId}/${attachmentId}`, "_blank");
+    if (!pdfWindow) {
       showToast("Failed to open PDF attachment", "error");
-    } finally {
-      setAttachmentLoadingId(null);
     }
   };
 
@@ -114,7 +120,8 @@ export default function EmailResponder() {
 
   const formatDate = (dateString) => {
     if (!dateString) return '';
-    const date = new Date(dateString);
+    // Gmail's internalDate is epoch milliseconds sent as a string
+    const date = new Date(isNaN(dateString) ? dateString : Number(dateString));
     return date.toLocaleString();
   };
 
@@ -191,15 +198,10 @@ export default function EmailResponder() {
                       {msg.attachments && msg.attachments.map((att, i) => (
                         <button
                           key={i}
-                          onClick={() => fetchAttachment(msg.id, att.id)}
-                          disabled={attachmentLoadingId === att.id}
+                          onClick={() => openAttachment(msg.id, att.id)}
                           className="attachment-button"
                         >
-                          {attachmentLoadingId === att.id ? (
-                            <><FiLoader className="spin" /> Opening...</>
-                          ) : (
-                            <><FiPaperclip /> {att.filename}</>
-                          )}
+                          <FiPaperclip /> {att.filename}
                         </button>
                       ))}
                     </div>